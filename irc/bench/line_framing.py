@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+# Compare IRCLineFramer with Twisted's LineReceiver on pipelined input
+# delivered in TCP-sized chunks.
+#
+# From the irc directory: PYTHONPATH=. python bench/line_framing.py [lines]
+
+from twisted.protocols.basic import LineReceiver
+
+from framer import IRCLineFramer
+
+import sys
+import time
+
+CHUNK_SIZE = 4096
+
+class Receiver(LineReceiver):
+    count = 0
+
+    def lineReceived(self, line):
+        self.count += 1
+
+class Framer(IRCLineFramer):
+    count = 0
+
+    def linesReceived(self, lines):
+        self.count += len(lines)
+
+def chunks(n):
+    data = ''.join('PRIVMSG #chan{} :message number {} from a pipelining '
+                   'client\r\n'.format(i % 10, i) for i in range(n))
+    return [data[i:i + CHUNK_SIZE] for i in range(0, len(data), CHUNK_SIZE)]
+
+def run(protocol, data):
+    start = time.time()
+    for chunk in data:
+        protocol.dataReceived(chunk)
+    return time.time() - start
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    data = chunks(n)
+
+    for name, protocol in [('LineReceiver', Receiver()),
+                           ('IRCLineFramer', Framer())]:
+        elapsed = run(protocol, data)
+        assert protocol.count == n
+        print '{:>14}: {:.0f} lines/s'.format(name, n / elapsed)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# Register a burst of clients on a server that requires a password, with
+# password checks run inline on the reactor thread and on a thread pool,
+# and report throughput and the longest time the reactor was stalled.
+#
+# From the irc directory: PYTHONPATH=. python bench/registration.py [clients]
+
+from twisted.internet import reactor
+from twisted.internet.task import LoopingCall
+
+from config import DEFAULT_CONFIG
+from passwords import hash_password
+from recorder import ReplayUser
+from server import Server
+
+import os
+import subprocess
+import sys
+import time
+
+TICK = 0.005
+
+def run(clients, threads):
+    config = DEFAULT_CONFIG._replace(password=hash_password('secret'),
+                                     check_threads=threads)
+    server = Server('bench', config, reactor)
+    server.checker.start()
+    users = [ReplayUser(i) for i in range(clients)]
+    result = {'stall': 0.0, 'start': time.time(), 'last': time.time()}
+
+    def tick():
+        now = time.time()
+        result['stall'] = max(result['stall'], now - result['last'])
+        result['last'] = now
+        if all(u.registered for u in users):
+            result['elapsed'] = now - result['start']
+            loop.stop()
+            reactor.stop()
+
+    def connect():
+        result['start'] = time.time()
+        for i, user in enumerate(users):
+            server.lines_received(user, ['PASS secret',
+                                         'NICK user{}'.format(i),
+                                         'USER user 0 * :User'])
+
+    loop = LoopingCall(tick)
+    reactor.callWhenRunning(connect)
+    reactor.callWhenRunning(loop.start, TICK)
+    reactor.run()
+    return result
+
+def main():
+    clients = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 0
+    if len(sys.argv) > 2:
+        sys.stdout = open(os.devnull, 'w')
+        result = run(clients, threads)
+        sys.stdout = sys.__stdout__
+        name = 'inline' if not threads else '{} threads'.format(threads)
+        print '{:>10}: {:.0f} registrations/s, reactor stalled up to ' \
+              '{:.0f} ms'.format(name, clients / result['elapsed'],
+                                 result['stall'] * 1000)
+        return
+
+    # the reactor can only run once per process
+    for threads in [0, 4]:
+        subprocess.call([sys.executable, sys.argv[0], str(clients),
+                         str(threads)])
+
+if __name__ == '__main__':
+    main()
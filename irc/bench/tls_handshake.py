@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# Measure TLS handshake throughput and latency against an in-process
+# listener, with and without session resumption.
+#
+# From the irc directory: PYTHONPATH=. python bench/tls_handshake.py [count]
+
+from twisted.internet import reactor, threads
+from OpenSSL import SSL
+
+from user import UserFactory
+from server import Server
+from tls import TLSContextFactory, HandshakeStats, make_self_signed
+
+import os
+import socket
+import sys
+import tempfile
+import time
+
+def connect(port, session=None):
+    sock = socket.create_connection(('127.0.0.1', port))
+    conn = SSL.Connection(SSL.Context(SSL.SSLv23_METHOD), sock)
+    conn.set_connect_state()
+    if session is not None:
+        conn.set_session(session)
+    conn.do_handshake()
+
+    # register and read the welcome so that TLS 1.3 session tickets,
+    # which follow the handshake, have been received
+    conn.sendall('NICK bench\r\nUSER bench 0 * :bench\r\n')
+    data = ''
+    while not ' 004 ' in data:
+        data += conn.recv(4096)
+    session = conn.get_session()
+
+    # an unclean close would mark the session as not resumable
+    conn.sendall('QUIT\r\n')
+    conn.shutdown()
+    sock.close()
+    return session
+
+def run(port, count, resume):
+    session = connect(port) if resume else None
+    start = time.time()
+    for i in range(count):
+        connect(port, session)
+    return time.time() - start
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+
+    tmp = tempfile.mkdtemp()
+    certfile = os.path.join(tmp, 'server.crt')
+    keyfile = os.path.join(tmp, 'server.key')
+    make_self_signed(certfile, keyfile)
+
+    server = Server("Bench")
+    port = reactor.listenSSL(0, UserFactory(server),
+                             TLSContextFactory(certfile, keyfile),
+                             interface='127.0.0.1').getHost().port
+
+    def bench():
+        for resume in [False, True]:
+            server.tls_stats = HandshakeStats()
+            elapsed = run(port, count, resume)
+            print '{:>8}: {:.0f} handshakes/s client side; server: {}'.format(
+                'resumed' if resume else 'full', count / elapsed,
+                server.tls_stats.report())
+
+    d = threads.deferToThread(bench)
+    d.addErrback(lambda f: f.printTraceback())
+    d.addBoth(lambda _: reactor.stop())
+    reactor.run()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+# Compare the lookup-table nick and channel checks with the regular
+# expressions they replaced (anchored, and allowing every channel type),
+# called the same way the server calls them, on a mix of valid and
+# invalid names.
+#
+# From the irc directory: PYTHONPATH=. python bench/validation.py [rounds]
+
+from validate import valid_nick, valid_chan
+
+import re
+import sys
+import time
+
+NICK_RE = re.compile('[a-zA-Z\[\]\\\`_^{|}][a-zA-Z0-9\[\]\\\`_^{|}-]{0,8}$')
+CHAN_RE = re.compile('[#&+!][\x01-\x06\x08-\x09\x0B-\x0C\x0E-\x1F'
+                     '\x21-\x2B\x2D-\x39\x3B-\xFF]{1,49}$')
+
+NICKS = ['shira', 'santa', 'a', 'abcdefghi', '[away]', 'nick_42', '9lives',
+         'abc!!', 'x' * 20, 'foo bar']
+CHANS = ['#chan', '&local', '#python', '+modeless', '!ABCDEsafe', '#a' * 30,
+         'chan', '#bad,name', '#bad name', '#']
+
+def run(check, names, rounds):
+    start = time.time()
+    for _ in xrange(rounds):
+        for name in names:
+            check(name)
+    return len(names) * rounds / (time.time() - start)
+
+def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+
+    for name, check in [
+            ('nick regex', lambda nick: bool(NICK_RE.match(nick))),
+            ('nick table', lambda nick: valid_nick(nick, 9))]:
+        print '{:>12}: {:.0f} checks/s'.format(name, run(check, NICKS, rounds))
+    for name, check in [
+            ('chan regex', lambda chan: bool(CHAN_RE.match(chan))),
+            ('chan table', lambda chan: valid_chan(chan, '#&+!', 50))]:
+        print '{:>12}: {:.0f} checks/s'.format(name, run(check, CHANS, rounds))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,29 @@
+CAPABILITIES = ('batch', 'echo-message', 'message-tags', 'server-time')
+
+# The capability a client must have enabled to be sent each tag; any
+# other tag is only sent to clients with message-tags
+TAG_CAPS = {'time': 'server-time', 'batch': 'batch'}
+
+def escape_tag_value(value):
+    return (value.replace('\\', '\\\\').replace(';', '\\:')
+                 .replace(' ', '\\s').replace('\r', '\\r')
+                 .replace('\n', '\\n'))
+
+def tag_line(line, tags, caps):
+    # Prefix line with the tags this set of capabilities asks for
+    wanted = ['{}={}'.format(name, escape_tag_value(value))
+              for name, value in tags
+              if TAG_CAPS.get(name, 'message-tags') in caps]
+    if not wanted:
+        return line
+    return '@{} {}'.format(';'.join(wanted), line)
+
+def parse_caps(arg):
+    # 'a -b c' -> [('a', True), ('b', False), ('c', True)]
+    caps = []
+    for name in arg.split():
+        if name.startswith('-'):
+            caps.append((name[1:], False))
+        else:
+            caps.append((name, True))
+    return caps
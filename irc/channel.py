@@ -1,12 +1,133 @@
+from mask import compile_masks
+
+from collections import OrderedDict
+
+LIST_MODES = 'beI'
+FLAG_MODES = 'imnpst'
+DEFAULT_MODES = 'nt'
+
 class Channel(object):
     def __init__(self, name):
         self.name = name
         self.users = []
+        self._positions = {}
         self._topic = ''
 
+        self.ops = set()
+        self.voiced = set()
+        self.modes = set(DEFAULT_MODES)
+        self.key = None
+        self.limit = None
+
+        self.lists = dict((mode, []) for mode in LIST_MODES)
+        self.invites = OrderedDict()
+        self._matchers = {}
+        self._banned = {}
+
     def set_topic(self, topic):
         self._topic = topic
 
     def get_topic(self):
         return self._topic
 
+    def add_user(self, user):
+        if not self.users:
+            self.ops.add(user)
+        self._positions[user] = len(self.users)
+        self.users.append(user)
+        self.invites.pop(user, None)
+
+    def remove_user(self, user):
+        # the last member moves into the leaving member's place so that
+        # nothing after it has to shift
+        index = self._positions.pop(user)
+        last = self.users.pop()
+        if last is not user:
+            self.users[index] = last
+            self._positions[last] = index
+        self.ops.discard(user)
+        self.voiced.discard(user)
+        self._banned.pop(user, None)
+
+    def has_user(self, user):
+        return user in self._positions
+
+    def invite(self, user, expires):
+        self.invites.pop(user, None)
+        self.invites[user] = expires
+
+    def is_invited(self, user, now):
+        # Invites are kept oldest first and usually last equally long, so
+        # the expired ones are at the front. A REHASH can change the expiry,
+        # so the user's own deadline is still checked.
+        invites = self.invites
+        while invites:
+            u, expires = next(invites.iteritems())
+            if expires > now:
+                break
+            del invites[u]
+        return invites.get(user, 0) > now
+
+    def mode_string(self):
+        modes = ''.join(sorted(self.modes))
+        params = []
+        if self.key is not None:
+            modes += 'k'
+            params.append(self.key)
+        if self.limit is not None:
+            modes += 'l'
+            params.append(str(self.limit))
+        return ' '.join(['+' + modes] + params)
+
+    def prefix(self, user):
+        if user in self.ops:
+            return '@'
+        if user in self.voiced:
+            return '+'
+        return ''
+
+    # Ban, exception and invite exception lists
+
+    def add_mask(self, mode, mask):
+        masks = self.lists[mode]
+        if mask in masks:
+            return False
+        masks.append(mask)
+        self._invalidate(mode)
+        return True
+
+    def remove_mask(self, mode, mask):
+        masks = self.lists[mode]
+        if mask not in masks:
+            return False
+        masks.remove(mask)
+        self._invalidate(mode)
+        return True
+
+    def _invalidate(self, mode):
+        self._matchers.pop(mode, None)
+        if mode in 'be':
+            self._banned.clear()
+
+    def matches(self, mode, hostmask):
+        try:
+            match = self._matchers[mode]
+        except KeyError:
+            match = self._matchers[mode] = compile_masks(self.lists[mode])
+        return match is not None and match(hostmask)
+
+    def is_banned(self, hostmask):
+        return (self.matches('b', hostmask) and
+                not self.matches('e', hostmask))
+
+    def member_banned(self, user, hostmask):
+        # Members are checked once and the result cached until the ban or
+        # exception lists change or the member changes nick
+        try:
+            return self._banned[user]
+        except KeyError:
+            banned = self._banned[user] = self.is_banned(hostmask)
+            return banned
+
+    def forget(self, user):
+        self._banned.pop(user, None)
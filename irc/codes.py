@@ -92,6 +92,7 @@ ERR_WASNOSUCHNICK = '406'
 ERR_TOOMANYTARGETS = '407'
 ERR_NOSUCHSERVICE = '408'
 ERR_NOORIGIN = '409'
+ERR_INVALIDCAPCMD = '410'
 ERR_NORECIPIENT = '411'
 ERR_NOTEXTTOSEND = '412'
 ERR_NOTOPLEVEL = '413'
@@ -0,0 +1,97 @@
+from ConfigParser import RawConfigParser, Error
+from collections import namedtuple
+
+# (field, section, option, type, default)
+OPTIONS = [
+    ('name', 'server', 'name', str, 'My Server'),
+    ('host', 'server', 'host', str, None),
+    ('motd_file', 'server', 'motd', str, None),
+    ('record_file', 'server', 'record', str, None),
+    ('password', 'server', 'password', str, None),
+    ('chantypes', 'server', 'chantypes', str, '#&+!'),
+    ('port', 'listen', 'port', int, 6667),
+    ('tls_port', 'listen', 'tls_port', int, 6697),
+    ('tls_cert', 'listen', 'tls_cert', str, 'server.crt'),
+    ('tls_key', 'listen', 'tls_key', str, 'server.key'),
+    ('nicklen', 'limits', 'nicklen', int, 9),
+    ('channellen', 'limits', 'channellen', int, 50),
+    ('userlen', 'limits', 'userlen', int, 10),
+    ('realnamelen', 'limits', 'realnamelen', int, 50),
+    ('sendq', 'limits', 'sendq', int, 65536),
+    ('flood_lines', 'limits', 'flood_lines', int, 100),
+    ('tick_budget', 'limits', 'tick_budget', int, 100),
+    ('targmax', 'limits', 'targmax', int, 4),
+    ('max_channels', 'limits', 'max_channels', int, 20),
+    ('who_replies', 'limits', 'who_replies', int, 200),
+    ('whowas', 'limits', 'whowas', int, 1024),
+    ('invite_expiry', 'limits', 'invite_expiry', int, 3600),
+    ('history_size', 'limits', 'history_size', int, 100),
+    ('history_budget', 'limits', 'history_budget', int, 16 * 1024 * 1024),
+    ('history_limit', 'limits', 'history_limit', int, 100),
+    ('check_threads', 'limits', 'check_threads', int, 4),
+    ('max_per_ip', 'connections', 'max_per_ip', int, 10),
+    ('max_per_net', 'connections', 'max_per_net', int, 50),
+    ('connect_rate', 'connections', 'connect_rate', float, 0.5),
+    ('connect_burst', 'connections', 'connect_burst', int, 5),
+    ('max_unregistered', 'connections', 'max_unregistered', int, 1000),
+    ('slow_command', 'debug', 'slow_command', float, 0.05),
+    ('profile_file', 'debug', 'profile', str, 'ircd.prof'),
+    ('profile_seconds', 'debug', 'profile_seconds', int, 30),
+]
+
+# zero or less would divide by zero, stall everyone or leave WHOWAS
+# nowhere to put a departing user
+POSITIVE = frozenset(['connect_rate', 'connect_burst', 'tick_budget',
+                      'whowas'])
+# zero turns the feature off, but less makes no sense
+NON_NEGATIVE = frozenset(['history_size', 'history_budget'])
+
+Config = namedtuple('Config',
+                    [o[0] for o in OPTIONS] + ['opers', 'motd', 'path'])
+
+DEFAULT_CONFIG = Config(*([o[4] for o in OPTIONS] + [{}, (), None]))
+
+class ConfigError(Exception):
+    pass
+
+def load_config(path):
+    # Everything is read and checked before a Config is built, so a bad
+    # file never leaves a half-applied configuration behind
+    parser = RawConfigParser()
+    try:
+        with open(path) as f:
+            parser.readfp(f)
+    except (IOError, Error) as e:
+        raise ConfigError('{}: {}'.format(path, e))
+
+    values = {}
+    for field, section, option, kind, default in OPTIONS:
+        if parser.has_option(section, option):
+            try:
+                values[field] = kind(parser.get(section, option))
+            except ValueError:
+                raise ConfigError('{}: [{}] {} must be {}'.format(
+                    path, section, option, kind.__name__))
+            if field in POSITIVE and values[field] <= 0:
+                raise ConfigError('{}: [{}] {} must be positive'.format(
+                    path, section, option))
+            if field in NON_NEGATIVE and values[field] < 0:
+                raise ConfigError('{}: [{}] {} must not be negative'.format(
+                    path, section, option))
+        else:
+            values[field] = default
+
+    # [opers] maps each operator name to a password hash
+    opers = {}
+    if parser.has_section('opers'):
+        opers = dict(parser.items('opers'))
+
+    motd = ()
+    if values['motd_file']:
+        try:
+            with open(values['motd_file']) as f:
+                motd = tuple(line.rstrip('\r\n') for line in f)
+        except IOError as e:
+            raise ConfigError('{}: {}'.format(values['motd_file'], e))
+
+    return Config(opers=opers, motd=motd, path=path, **values)
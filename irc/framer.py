@@ -0,0 +1,56 @@
+from twisted.internet.protocol import Protocol
+
+# RFC 1459 allows 512 bytes including the CR LF; IRCv3 message tags may
+# add up to 8191 more bytes including the leading '@' and trailing space
+MAX_LINE_LENGTH = 510
+MAX_TAGS_LENGTH = 8191
+MAX_BUFFER = MAX_TAGS_LENGTH + MAX_LINE_LENGTH + 2
+
+def truncate(line):
+    if line[0] == '@':
+        tags, space, message = line.partition(' ')
+        if len(tags) + 1 > MAX_TAGS_LENGTH:
+            return None
+        return tags + space + message[:MAX_LINE_LENGTH]
+    return line[:MAX_LINE_LENGTH]
+
+class IRCLineFramer(Protocol):
+    # Splits everything received in a chunk at once and passes the complete
+    # lines on together. Lines may end in CR LF or a bare LF; overlong lines
+    # are truncated to the protocol limit rather than buffered.
+    delimiter = '\r\n'
+
+    def __init__(self):
+        self._buffer = bytearray()
+
+    def dataReceived(self, data):
+        buf = self._buffer
+        if buf:
+            buf += data
+            data = str(buf)
+            del buf[:]
+
+        lines = data.split('\n')
+        rest = lines.pop()
+        if rest:
+            buf += rest[:MAX_BUFFER]
+
+        complete = []
+        for line in lines:
+            if line[-1:] == '\r':
+                line = line[:-1]
+            if len(line) > MAX_LINE_LENGTH:
+                line = truncate(line)
+            if line:
+                complete.append(line)
+
+        if complete:
+            self.linesReceived(complete)
+
+    def linesReceived(self, lines):
+        # Subclasses override this to handle the complete lines from one
+        # chunk of data, in the order they arrived
+        raise NotImplementedError
+
+    def sendLine(self, line):
+        self.transport.write(line + self.delimiter)
@@ -0,0 +1,179 @@
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict, deque, namedtuple
+
+import calendar
+import time
+
+# Rough per-entry cost on top of the line itself, including its tags,
+# used for the budget
+ENTRY_OVERHEAD = 192
+
+# time is in whole milliseconds, exactly as sent in the server-time tag,
+# so a client resuming from a time it was sent doesn't see that message
+# again
+HistoryEntry = namedtuple('HistoryEntry', 'msgid time tags line')
+
+def milliseconds(t):
+    return int(t * 1000)
+
+def server_time(t):
+    ms = milliseconds(t)
+    return '{}.{:03d}Z'.format(time.strftime('%Y-%m-%dT%H:%M:%S',
+                                             time.gmtime(ms // 1000)),
+                               ms % 1000)
+
+def parse_point(point):
+    # 'msgid=...' or 'timestamp=...' as used by CHATHISTORY; timestamps
+    # come back in milliseconds
+    kind, _, value = point.partition('=')
+    try:
+        if kind == 'msgid':
+            return 'msgid', int(value)
+        if kind == 'timestamp':
+            seconds, _, fraction = value.rstrip('Z').partition('.')
+            t = calendar.timegm(time.strptime(seconds, '%Y-%m-%dT%H:%M:%S'))
+            if fraction and not fraction.isdigit():
+                return None
+            return 'time', t * 1000 + int((fraction + '000')[:3])
+    except ValueError:
+        pass
+    return None
+
+class ChannelHistory(object):
+    # The most recent messages of one channel, oldest first, as the lines
+    # that were sent so replaying them needs no formatting. The msgids and
+    # times are kept alongside so a query can bisect them directly.
+    def __init__(self, size):
+        self.size = size
+        self.entries = deque()
+        self.keys = {'msgid': deque(), 'time': deque()}
+        self.bytes = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def append(self, entry):
+        # returns the change in bytes held
+        added = len(entry.line) + ENTRY_OVERHEAD
+        self.entries.append(entry)
+        self.keys['msgid'].append(entry.msgid)
+        self.keys['time'].append(entry.time)
+        self.bytes += added
+        return added - self.trim()
+
+    def resize(self, size):
+        # returns the bytes freed
+        self.size = size
+        return self.trim()
+
+    def trim(self):
+        freed = 0
+        while len(self.entries) > self.size:
+            freed += self.pop_oldest()
+        return freed
+
+    def pop_oldest(self):
+        entry = self.entries.popleft()
+        self.keys['msgid'].popleft()
+        self.keys['time'].popleft()
+        freed = len(entry.line) + ENTRY_OVERHEAD
+        self.bytes -= freed
+        return freed
+
+    def _index(self, point, right=False):
+        key, value = point
+        keys = self.keys[key]
+        if right:
+            return bisect_right(keys, value)
+        return bisect_left(keys, value)
+
+    def _slice(self, start, end):
+        entries = self.entries
+        return [entries[i] for i in xrange(max(start, 0),
+                                           min(end, len(entries)))]
+
+    def latest(self, point, limit):
+        end = len(self.entries)
+        start = end - limit
+        if point is not None:
+            start = max(start, self._index(point, True))
+        return self._slice(start, end)
+
+    def before(self, point, limit):
+        end = self._index(point)
+        return self._slice(end - limit, end)
+
+    def after(self, point, limit):
+        start = self._index(point, True)
+        return self._slice(start, start + limit)
+
+    def around(self, point, limit):
+        start = self._index(point) - limit // 2
+        return self._slice(start, max(start, 0) + limit)
+
+    def between(self, first, second, limit):
+        # the points may be a msgid and a timestamp, so they are compared
+        # by where they fall in the history rather than by value
+        ascending = self._index(first) <= self._index(second)
+        if not ascending:
+            first, second = second, first
+        start = self._index(first, True)
+        end = self._index(second)
+        if ascending:
+            return self._slice(start, min(end, start + limit))
+        return self._slice(max(start, end - limit), end)
+
+class HistoryStore(object):
+    # Histories of all channels under one memory budget. Channels are kept
+    # in least recently used order and the oldest messages of the least
+    # recently used channel are dropped first when over budget.
+    def __init__(self, size, budget):
+        self.size = size
+        self.budget = budget
+        self.bytes = 0
+        self.channels = OrderedDict()
+        self.next_msgid = 1
+
+    def add(self, chan, line, now):
+        msgid = self.next_msgid
+        self.next_msgid += 1
+        entry = HistoryEntry(msgid, milliseconds(now),
+                             (('time', server_time(now)),
+                              ('msgid', str(msgid))),
+                             line)
+
+        history = self.channels.pop(chan, None)
+        if history is None:
+            history = ChannelHistory(self.size)
+        self.channels[chan] = history
+        self.bytes += history.append(entry)
+        self.evict()
+        return entry
+
+    def get(self, chan):
+        history = self.channels.pop(chan, None)
+        if history is None:
+            return ChannelHistory(self.size)
+        self.channels[chan] = history
+        return history
+
+    def resize(self, size):
+        self.size = size
+        channels = self.channels
+        for chan, history in channels.items():
+            self.bytes -= history.resize(size)
+            if not history:
+                del channels[chan]
+
+    def remove(self, chan):
+        history = self.channels.pop(chan, None)
+        if history is not None:
+            self.bytes -= history.bytes
+
+    def evict(self):
+        channels = self.channels
+        while self.bytes > self.budget and channels:
+            chan, history = next(channels.iteritems())
+            self.bytes -= history.pop_oldest()
+            if not history:
+                del channels[chan]
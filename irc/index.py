@@ -0,0 +1,81 @@
+from mask import irc_lower
+
+class ChannelIndex(object):
+    # Channels indexed by folded name, so every lookup follows the
+    # CASEMAPPING advertised in ISUPPORT
+    def __init__(self):
+        self._names = {}
+
+    def __len__(self):
+        return len(self._names)
+
+    def __iter__(self):
+        return self._names.itervalues()
+
+    def __contains__(self, name):
+        return irc_lower(name) in self._names
+
+    def __getitem__(self, name):
+        return self._names[irc_lower(name)]
+
+    def get(self, name, default=None):
+        return self._names.get(irc_lower(name), default)
+
+    def add(self, chan):
+        self._names[irc_lower(chan.name)] = chan
+
+    def remove(self, chan):
+        del self._names[irc_lower(chan.name)]
+
+class UserIndex(object):
+    # Registered users indexed by folded nick, host and folded realname so
+    # that queries naming one of these resolve without scanning every user
+    def __init__(self):
+        self._nicks = {}
+        self._hosts = {}
+        self._realnames = {}
+
+    def __len__(self):
+        return len(self._nicks)
+
+    def __iter__(self):
+        return self._nicks.itervalues()
+
+    def __contains__(self, nick):
+        return irc_lower(nick) in self._nicks
+
+    def get(self, nick, default=None):
+        return self._nicks.get(irc_lower(nick), default)
+
+    def add(self, user):
+        self._nicks[irc_lower(user.nick)] = user
+        self._add(self._hosts, user.host, user)
+        self._add(self._realnames, irc_lower(user.realname or ''), user)
+
+    def remove(self, user):
+        del self._nicks[irc_lower(user.nick)]
+        self._discard(self._hosts, user.host, user)
+        self._discard(self._realnames, irc_lower(user.realname or ''), user)
+
+    def rename(self, user, old):
+        del self._nicks[irc_lower(old)]
+        self._nicks[irc_lower(user.nick)] = user
+
+    def by_host(self, host):
+        return self._hosts.get(host, ())
+
+    def by_realname(self, realname):
+        return self._realnames.get(irc_lower(realname), ())
+
+    def _add(self, index, key, user):
+        try:
+            index[key].add(user)
+        except KeyError:
+            index[key] = set([user])
+
+    def _discard(self, index, key, user):
+        users = index.get(key)
+        if users is not None:
+            users.discard(user)
+            if not users:
+                del index[key]
@@ -1,12 +1,66 @@
 #!/usr/bin/env python
 
 from twisted.internet import reactor
+from twisted.internet.task import LoopingCall
 
 from user import UserFactory
 from server import Server
+from config import DEFAULT_CONFIG, ConfigError, load_config
+from recorder import TrafficRecorder
+
+import os
+import signal
+import sys
+
+TLS_REPORT_INTERVAL = 60
+
+def listen_tls(server, factory, config):
+    try:
+        from tls import TLSContextFactory, HandshakeStats
+    except ImportError:
+        print "pyOpenSSL is not installed, not listening for TLS"
+        return
+
+    if not (os.path.exists(config.tls_cert) and
+            os.path.exists(config.tls_key)):
+        print "No {} and {}, not listening for TLS".format(config.tls_cert,
+                                                          config.tls_key)
+        return
+
+    stats = server.tls_stats = HandshakeStats()
+    reactor.listenSSL(config.tls_port, factory,
+                      TLSContextFactory(config.tls_cert, config.tls_key))
+    LoopingCall(report_tls, stats).start(TLS_REPORT_INTERVAL, now=False)
+
+def report_tls(stats):
+    if stats.count:
+        print stats.report()
 
 def main():
-    reactor.listenTCP(6667, UserFactory(Server("My Server")))
+    if len(sys.argv) > 1:
+        try:
+            config = load_config(sys.argv[1])
+        except ConfigError as e:
+            sys.exit(str(e))
+    else:
+        config = DEFAULT_CONFIG
+
+    server = Server(config.name, config)
+    factory = UserFactory(server)
+    reactor.listenTCP(config.port, factory)
+    listen_tls(server, factory, config)
+    server.checker.start()
+
+    if config.record_file:
+        server.recorder = TrafficRecorder(open(config.record_file, 'wb'))
+        reactor.addSystemEventTrigger('before', 'shutdown',
+                                      server.recorder.close)
+
+    signal.signal(signal.SIGHUP,
+                  lambda signum, frame: reactor.callFromThread(server.rehash))
+    signal.signal(signal.SIGUSR1,
+                  lambda signum, frame:
+                      reactor.callFromThread(server.toggle_profile))
     reactor.run()
 
 if __name__ == "__main__":
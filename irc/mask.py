@@ -0,0 +1,68 @@
+import re
+import string
+
+# RFC 1459 casemapping treats []\~ as the upper case forms of {}|^
+_lower = string.maketrans(string.ascii_uppercase + '[]\\~',
+                          string.ascii_lowercase + '{}|^')
+
+def irc_lower(s):
+    return s.translate(_lower)
+
+def has_wildcards(mask):
+    return '*' in mask or '?' in mask
+
+def glob_match(mask, s):
+    # Classic wildcard match that, on a mismatch, only ever backtracks to
+    # the most recent '*', so a mask costs at most len(mask) * len(s) steps
+    # however many stars it has
+    m = n = 0
+    star = -1
+    mark = 0
+    mlen, slen = len(mask), len(s)
+    while n < slen:
+        if m < mlen and mask[m] == '*':
+            star = m
+            m += 1
+            mark = n
+        elif m < mlen and (mask[m] == '?' or mask[m] == s[n]):
+            m += 1
+            n += 1
+        elif star >= 0:
+            m = star + 1
+            mark += 1
+            n = mark
+        else:
+            return False
+    while m < mlen and mask[m] == '*':
+        m += 1
+    return m == mlen
+
+def compile_masks(masks):
+    # Fold and tidy the masks once so checking a hostmask against the
+    # whole list only folds the hostmask
+    if not masks:
+        return None
+    folded = []
+    for mask in masks:
+        mask = re.sub(r'\*+', '*', irc_lower(mask))
+        if mask not in folded:
+            folded.append(mask)
+
+    def match(s):
+        s = irc_lower(s)
+        for mask in folded:
+            if glob_match(mask, s):
+                return True
+        return False
+    return match
+
+def normalize_mask(mask):
+    # Expand a partial mask such as 'nick' or 'user@host' to 'nick!user@host'
+    if '!' not in mask:
+        if '@' in mask:
+            mask = '*!' + mask
+        else:
+            mask = mask + '!*@*'
+    elif '@' not in mask:
+        mask = mask + '@*'
+    return mask
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+
+from twisted.internet.defer import maybeDeferred
+from twisted.internet.threads import deferToThreadPool
+from twisted.python.threadpool import ThreadPool
+
+import base64
+import getpass
+import hashlib
+import hmac
+import os
+
+try:
+    import bcrypt
+except ImportError:
+    bcrypt = None
+
+ITERATIONS = 100000
+CHECK_THREADS = 4
+
+def hash_password(password, iterations=ITERATIONS, salt=None):
+    # pbkdf2_sha256$iterations$salt$hash, salt and hash base64 encoded
+    if salt is None:
+        salt = os.urandom(16)
+    digest = hashlib.pbkdf2_hmac('sha256', password, salt, iterations)
+    return 'pbkdf2_sha256${}${}${}'.format(iterations,
+                                           base64.b64encode(salt),
+                                           base64.b64encode(digest))
+
+def check_password(password, hashed):
+    # Slow on purpose; run through PasswordChecker rather than directly
+    # on the reactor thread. Hashes starting with $2 are bcrypt, which is
+    # only checked if the bcrypt module is installed.
+    if hashed.startswith('$2'):
+        if bcrypt is None:
+            print "bcrypt is not installed, cannot check bcrypt hash"
+            return False
+        try:
+            return bcrypt.checkpw(password, hashed)
+        except ValueError:
+            # a malformed hash matches nothing
+            return False
+
+    try:
+        scheme, iterations, salt, digest = hashed.split('$')
+        if scheme != 'pbkdf2_sha256':
+            return False
+        salt = base64.b64decode(salt)
+        digest = base64.b64decode(digest)
+        iterations = int(iterations)
+    except (ValueError, TypeError):
+        return False
+    return hmac.compare_digest(
+        hashlib.pbkdf2_hmac('sha256', password, salt, iterations), digest)
+
+class PasswordChecker(object):
+    # Checks passwords on a bounded pool of threads so that a burst of
+    # registrations doesn't stall every other client. Until the pool is
+    # started, and with no threads at all, checks run inline.
+    def __init__(self, reactor, threads=CHECK_THREADS):
+        self.reactor = reactor
+        self.pool = None
+        self.pending = 0
+        if threads:
+            self.pool = ThreadPool(0, threads, 'password-check')
+
+    def start(self):
+        if self.pool is not None and not self.pool.started:
+            self.pool.start()
+            self.reactor.addSystemEventTrigger('during', 'shutdown',
+                                               self.pool.stop)
+
+    def check(self, password, hashed):
+        self.pending += 1
+        if self.pool is None or not self.pool.started:
+            d = maybeDeferred(check_password, password, hashed)
+        else:
+            d = deferToThreadPool(self.reactor, self.pool, check_password,
+                                  password, hashed)
+        d.addBoth(self._done)
+        d.addErrback(self._failed)
+        return d
+
+    def _done(self, result):
+        self.pending -= 1
+        return result
+
+    def _failed(self, failure):
+        # a check that breaks is a mismatch, so whoever waits on it is
+        # always answered
+        print "Password check failed: {}".format(failure.getErrorMessage())
+        return False
+
+if __name__ == "__main__":
+    print hash_password(getpass.getpass())
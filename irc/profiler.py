@@ -0,0 +1,39 @@
+import cProfile
+
+MAX_PROFILE_SECONDS = 300
+
+class Profiler(object):
+    # Profiles the running reactor for a while and writes the stats to a
+    # file that pstats or snakeviz can read
+    def __init__(self, clock):
+        self.clock = clock
+        self.profile = None
+        self.path = None
+        self._call = None
+
+    @property
+    def running(self):
+        return self.profile is not None
+
+    def start(self, seconds, path):
+        if self.running:
+            return False
+        seconds = max(1, min(seconds, MAX_PROFILE_SECONDS))
+        self.path = path
+        self.profile = cProfile.Profile()
+        self.profile.enable()
+        self._call = self.clock.callLater(seconds, self.stop)
+        return True
+
+    def stop(self):
+        if not self.running:
+            return None
+        if self._call.active():
+            self._call.cancel()
+        self._call = None
+
+        profile, self.profile = self.profile, None
+        profile.disable()
+        profile.dump_stats(self.path)
+        print "Wrote profile to {}".format(self.path)
+        return self.path
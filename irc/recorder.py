@@ -0,0 +1,155 @@
+import struct
+import time
+
+# Each record is a header followed by the line itself: the time the line
+# was handled, a number identifying the connection, and the line length.
+# A length of CLOSED marks the connection going away.
+MAGIC = 'IRCREC1\n'
+HEADER = struct.Struct('!dIH')
+CLOSED = 0xffff
+
+class TrafficRecorder(object):
+    def __init__(self, f, clock=time.time):
+        self.f = f
+        self.clock = clock
+        self.ids = {}
+        self.next_id = 0
+        f.write(MAGIC)
+
+    def conn_id(self, user):
+        try:
+            return self.ids[user]
+        except KeyError:
+            conn = self.ids[user] = self.next_id
+            self.next_id += 1
+            return conn
+
+    def record(self, user, line):
+        self.f.write(HEADER.pack(self.clock(), self.conn_id(user), len(line)))
+        self.f.write(line)
+
+    def closed(self, user):
+        conn = self.ids.pop(user, None)
+        if conn is not None:
+            self.f.write(HEADER.pack(self.clock(), conn, CLOSED))
+
+    def close(self):
+        self.f.close()
+
+def read_records(f):
+    if f.read(len(MAGIC)) != MAGIC:
+        raise ValueError('not a traffic recording')
+
+    while True:
+        header = f.read(HEADER.size)
+        if len(header) < HEADER.size:
+            return
+        timestamp, conn, length = HEADER.unpack(header)
+        if length == CLOSED:
+            yield timestamp, conn, None
+        else:
+            yield timestamp, conn, f.read(length)
+
+class ReplayUser(object):
+    # Stands in for User; only counts what the server sends
+    def __init__(self, conn):
+        self.nick = '*'
+        self.registered = False
+        self.username = None
+        self.realname = None
+        self.host = 'replay{}'.format(conn)
+        self.oper = False
+        self.channels = []
+        self.caps = frozenset()
+        self.cap_negotiating = False
+        self.password = None
+        self.checking = False
+        self.authenticated = False
+        self.away = None
+        self.closed = False
+        self.sent = 0
+
+    def send(self, line):
+        self.sent += 1
+
+    def close(self):
+        self.closed = True
+
+class ReplayStats(object):
+    def __init__(self):
+        self.lines = 0
+        self.sent = 0
+        self.elapsed = 0.0
+        self.wall = 0.0
+        self.commands = {}
+
+    def add(self, command, elapsed):
+        self.lines += 1
+        try:
+            stats = self.commands[command]
+        except KeyError:
+            stats = self.commands[command] = [0, 0.0, 0.0]
+        stats[0] += 1
+        stats[1] += elapsed
+        stats[2] = max(stats[2], elapsed)
+
+    def report(self):
+        lines = ['{} lines in {:.3f} s ({:.3f} s in handlers), {:.0f} lines/s '
+                 'handled, {} lines sent'.format(
+                     self.lines, self.wall, self.elapsed,
+                     self.lines / self.elapsed if self.elapsed else 0,
+                     self.sent),
+                 '{:<12} {:>8} {:>10} {:>10} {:>10}'.format(
+                     'command', 'count', 'total ms', 'mean us', 'max us')]
+        for command, (count, total, worst) in sorted(
+                self.commands.iteritems(), key=lambda c: -c[1][1]):
+            lines.append('{:<12} {:>8} {:>10.1f} {:>10.1f} {:>10.1f}'.format(
+                command, count, total * 1000, total / count * 1e6,
+                worst * 1e6))
+        return '\n'.join(lines)
+
+def replay(records, server, speed=None, clock=time.time, sleep=time.sleep):
+    # Feed recorded lines to the server in order. With a speed the
+    # original spacing is kept, divided by speed; without one lines are
+    # replayed as fast as possible.
+    users = {}
+    replayed = []
+    stats = ReplayStats()
+    began = clock()
+    start = None
+    first = None
+
+    for timestamp, conn, line in records:
+        if speed:
+            if start is None:
+                start, first = clock(), timestamp
+            delay = (timestamp - first) / speed - (clock() - start)
+            if delay > 0:
+                sleep(delay)
+
+        user = users.get(conn)
+        if line is None:
+            if user is not None:
+                del users[conn]
+                server.connection_lost(user)
+            continue
+        if user is None:
+            user = users[conn] = ReplayUser(conn)
+            replayed.append(user)
+        if user.closed:
+            continue
+
+        parsed = server.parse_msg(line)
+        command = parsed[1] if parsed is not None else ''
+        before = clock()
+        server.msg_received(user, line)
+        elapsed = clock() - before
+        stats.add(command, elapsed)
+        stats.elapsed += elapsed
+
+    for user in users.values():
+        server.connection_lost(user)
+
+    stats.wall = clock() - began
+    stats.sent = sum(user.sent for user in replayed)
+    return stats
@@ -0,0 +1,37 @@
+#!/usr/bin/env python
+
+from twisted.internet.task import Clock
+
+from server import Server
+from recorder import read_records, replay
+
+import argparse
+import os
+import sys
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Replay recorded client traffic into a server')
+    parser.add_argument('recording')
+    parser.add_argument('--speed', type=float, default=None,
+                        help='replay at this multiple of the recorded '
+                             'speed (default: as fast as possible)')
+    args = parser.parse_args()
+
+    server = Server("Replay", clock=Clock())
+    with open(args.recording, 'rb') as f:
+        records = list(read_records(f))
+
+    # keep the server's per-line logging out of the measurement
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    try:
+        stats = replay(records, server, args.speed)
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+    print stats.report()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+from collections import deque
+
+import traceback
+
+TICK_BUDGET = 100
+
+class InputScheduler(object):
+    # Lines are queued per connection and handled one line per connection
+    # in turn, at most `budget` lines per reactor tick, so a client that
+    # pipelines a large burst cannot hold up everyone else
+    def __init__(self, handler, clock, budget=TICK_BUDGET):
+        self.handler = handler
+        self.clock = clock
+        self.budget = budget
+        self.queues = {}
+        self.ready = deque()
+        self._call = None
+
+    def enqueue(self, user, lines):
+        queue = self.queues.get(user)
+        if queue is None:
+            queue = self.queues[user] = deque()
+            self.ready.append((user, queue))
+        queue.extend(lines)
+
+        if self._call is None:
+            self._call = self.clock.callLater(0, self.drain)
+        return len(queue)
+
+    def remove(self, user):
+        # the user's turn left in `ready` is skipped when it comes up
+        self.queues.pop(user, None)
+
+    def drain(self):
+        self._call = None
+        queues = self.queues
+        ready = self.ready
+        handler = self.handler
+
+        budget = self.budget
+        while ready and budget > 0:
+            user, queue = ready.popleft()
+            if queues.get(user) is not queue:
+                continue
+
+            line = queue.popleft()
+            try:
+                handler(user, line)
+            except Exception:
+                # a line that breaks its handler is dropped rather than
+                # stalling everyone else's input
+                print "Error handling {!r} from {}".format(
+                    line, getattr(user, 'nick', user))
+                traceback.print_exc()
+            budget -= 1
+
+            if queues.get(user) is queue:
+                if queue:
+                    ready.append((user, queue))
+                else:
+                    del queues[user]
+
+        if ready:
+            self._call = self.clock.callLater(0, self.drain)
+
+    def queued(self):
+        return sum(len(queue) for queue in self.queues.itervalues())
+
+    def queue_lengths(self):
+        return dict((user, len(queue))
+                    for user, queue in self.queues.iteritems())
@@ -1,64 +1,150 @@
 from user import UserFactory, UNSET_NICK
-from channel import Channel
+from channel import Channel, LIST_MODES, FLAG_MODES
+from index import ChannelIndex, UserIndex
+from mask import normalize_mask, has_wildcards, compile_masks
+from whowas import WhowasHistory
+from config import DEFAULT_CONFIG, ConfigError, load_config
+from scheduler import InputScheduler
+from throttle import ConnectionThrottle
+from history import HistoryStore, parse_point, server_time
+from caps import CAPABILITIES, TAG_CAPS, tag_line, parse_caps
+from profiler import Profiler
+from passwords import PasswordChecker
+from validate import valid_nick, valid_chan
 from codes import *
 
-import re
 import socket
+import time
 
-MAX_NICK_LEN = 9
+MAX_USERHOST_TARGETS = 5
+
+# arguments of these are not logged or recorded
+SECRET_COMMANDS = ('pass', 'oper')
 
 class Server(object):
-    def __init__(self, name):
+    def __init__(self, name, config=DEFAULT_CONFIG, clock=None):
+        if clock is None:
+            from twisted.internet import reactor as clock
+
         self.name = name[:64]
-        self.users = {}
-        self.channels = {}
+        self.config = config
+        self.clock = clock
+        self.scheduler = InputScheduler(self.msg_received, clock,
+                                        config.tick_budget)
+        self.throttle = ConnectionThrottle(config, clock)
+        self.history = HistoryStore(config.history_size,
+                                    config.history_budget)
+        self.profiler = Profiler(clock)
+        self.checker = PasswordChecker(clock, config.check_threads)
+        self.timer = time.time
+        self.sent = 0
+        self.slow_commands = 0
+        self.users = UserIndex()
+        self.whowas = WhowasHistory(config.whowas)
+        self.tls_stats = None
+        self.recorder = None
+        self.channels = ChannelIndex()
+        self.next_batch = 0
+        # kept up to date as users and channels come and go so LUSERS
+        # never has to count anything
+        self.opers = set()
+        # channels each user has been invited to, so quitting drops them
+        self.invited = {}
+        self.channel_count = 0
 
-        self.host = socket.getfqdn()
+        self.host = config.host or socket.getfqdn()
         self.version = "irc-sds-0.1"
-        self.createdate = "Thu Oct 24 2013 at 07:23:58 EST"
-
-        self.reg_required = ['join', 'part', 'privmsg']
+        self.createdate = time.strftime("%a %b %d %Y at %H:%M:%S %Z")
+        self.cache_motd()
 
-        self.nick_re = re.compile('[a-zA-Z\[\]\\\`_^{|}]'
-                                  '[a-zA-Z0-9\[\]\\\`_^{|}-]{0,8}')
-        self.chan_re = re.compile('[&][\x01-\x06\x08-\x09\x0B-\x0C\x0E-\x1F'
-                                  '\x21-\x2B\x2D-\x39\x3B-\xFF]{1,49}$')
+        self.reg_required = ['join', 'part', 'privmsg', 'mode', 'who',
+                             'whois', 'whowas', 'ison', 'userhost', 'motd',
+                             'rehash', 'stats', 'notice', 'chathistory',
+                             'profile', 'oper', 'lusers', 'kick', 'invite',
+                             'away']
 
     def valid_nick(self, nick):
-        return bool(self.nick_re.match(nick))
+        return valid_nick(nick, self.config.nicklen)
 
     def valid_chan(self, chan):
-        return bool(self.chan_re.match(chan))
+        return valid_chan(chan, self.config.chantypes, self.config.channellen)
 
     def parse_msg(self, msg):
-        string = msg
+        # returns None for a line with no command, which is ignored
+        string = msg.lstrip(' ')
         prefix = ''
-        if string[0] == ':':
-            prefix, string = string[1:].split(' ', 1)
-        if string.find(':') != -1:
-            string, trailing = string.rsplit(':', 1)
+        if string.startswith('@'):
+            # tags sent by clients are not used
+            string = string.partition(' ')[2].lstrip(' ')
+        if string.startswith(':'):
+            prefix, _, string = string[1:].partition(' ')
+            string = string.lstrip(' ')
+        if string.find(' :') != -1:
+            string, trailing = string.split(' :', 1)
             parts = string.split()
             parts.append(trailing)
         else:
             parts = string.split()
+        if not parts:
+            return None
         return prefix, parts[0].lower(), parts[1:]
 
     def msg_received(self, user, msg):
-        print "received from {}: {}".format(user.nick, msg)
-        self.command(user, *self.parse_msg(msg))
+        parsed = self.parse_msg(msg)
+        logged = msg
+        if parsed is not None and parsed[1].lower() in SECRET_COMMANDS:
+            # passwords stay out of the log and the recording; a replay
+            # sees the command without its arguments
+            logged = '{} <hidden>'.format(parsed[1])
+        print "received from {}: {}".format(user.nick, logged)
+        if self.recorder is not None:
+            self.recorder.record(user, logged)
+        if parsed is not None:
+            self.command(user, *parsed)
+
+    def lines_received(self, user, lines):
+        if self.scheduler.enqueue(user, lines) > self.config.flood_lines:
+            print "Excess flood from {}".format(user.nick)
+            self.quit(user, 'Excess Flood')
+            user.close()
 
     def command(self, user, prefix, command, args):
         if not user.registered and command in self.reg_required:
             self.respond(user, self.host, ERR_NOTREGISTERED,
                          [':You have not registered'])
         else:
-            try:
-                getattr(self, "cmd_{}".format(command.lower()))(user, args)
-            except AttributeError:
+            handler = getattr(self, "cmd_{}".format(command.lower()), None)
+            if handler is None:
                 print "Unsupported IRC command: {} {}".format(command, args)
+                return
+
+            start = self.timer()
+            sent = self.sent
+            handler(user, args)
+            elapsed = self.timer() - start
+            threshold = self.config.slow_command
+            if threshold and elapsed >= threshold:
+                self.slow_command(user, command, args, elapsed,
+                                  self.sent - sent)
+
+    def slow_command(self, user, command, args, elapsed, sent):
+        self.slow_commands += 1
+        if command.lower() in SECRET_COMMANDS:
+            args = ['<hidden>']
+        print ("Slow command from {}: {} {} took {:.1f} ms, {} lines "
+               "sent".format(user.nick, command.upper(), args,
+                             elapsed * 1000, sent))
+
+    def handshake_completed(self, user, latency):
+        if self.tls_stats is not None:
+            self.tls_stats.record(latency, user.transport.getHandle())
+
+    def hostmask(self, user):
+        return '{}!{}@{}'.format(user.nick, user.username, user.host)
 
     def register(self, user, nick):
-        self.users[nick] = user
+        self.users.add(user)
+        self.throttle.registered(user)
         user.registered = True
 
         self.respond(user, self.host, RPL_WELCOME, 
@@ -71,6 +157,24 @@ class Server(object):
                      [':This server was created {}'.format(self.createdate)])
         self.respond(user, self.host, RPL_MYINFO,
                      ['{} {}'.format(self.host, self.version)])
+        self.respond(user, self.host, RPL_ISUPPORT,
+                     self.isupport() + [':are supported by this server'])
+        self.send_lusers(user)
+        self.send_motd(user)
+
+    def isupport(self):
+        config = self.config
+        return ['CASEMAPPING=rfc1459',
+                'CHANLIMIT={}:{}'.format(config.chantypes,
+                                         config.max_channels),
+                'CHANMODES={},k,l,{}'.format(LIST_MODES, FLAG_MODES),
+                'CHANNELLEN={}'.format(config.channellen),
+                'CHANTYPES={}'.format(config.chantypes),
+                'EXCEPTS', 'INVEX',
+                'MAXTARGETS={}'.format(config.targmax),
+                'NICKLEN={}'.format(config.nicklen),
+                'PREFIX=(ov)@+',
+                'USERLEN={}'.format(config.userlen)]
 
     def notify_set(self, user):
         notify = []
@@ -82,8 +186,9 @@ class Server(object):
         # don't worry about length of message for now
         names = []
         for u in chan.users:
-            names.append(u.nick)
+            names.append((u.nick, chan.prefix(u)))
         names.sort()
+        names = [prefix + nick for nick, prefix in names]
         
         self.respond(user, self.host, RPL_NAMREPLY,
                      ['@ {} :{}'.format(chan.name, ' '.join(names))])
@@ -98,36 +203,37 @@ class Server(object):
                      self.respond(user, self.host, ERR_NEEDMOREPARAMS,
                                   ['PASS :Not enough parameters'])
         else:
-            # Ignore the password
-            pass
+            user.password = args[0]
 
     def cmd_nick(self, user, args):
         if args == []:
             self.respond(user, self.host, ERR_NONICKNAMEGIVEN, 
                          [':No nickname given'])
         else:
-            nick = args[0][:MAX_NICK_LEN]
+            nick = args[0][:self.config.nicklen]
 
             if not self.valid_nick(nick):
                 self.respond(user, self.host, ERR_ERRONEUSNICKNAME, 
                              [nick, ':Erroneous nickname'])
-            elif nick in self.users:
+            elif self.users.get(nick, user) is not user:
                     self.respond(user, self.host, ERR_NICKNAMEINUSE,
                                  [nick, ':Nickname is already in use'])
             elif not user.registered:
                 user.nick = nick
-
-                if user.realname:
-                    self.register(user, nick)
+                self.try_register(user)
             else:
                 old = user.nick
-                del self.users[old]
-                
+                self.whowas.add(old, user)
                 user.nick = nick
-                self.users[nick] = user
+                self.users.rename(user, old)
+
+                for c in user.channels:
+                    c.forget(user)
 
-                for u in self.notify_set(user):
-                    self.respond(u, old, 'NICK', [])                 
+                notify = self.notify_set(user)
+                notify.add(user)
+                self.broadcast(notify, ':{} NICK {}'.format(old, nick),
+                               tags=self.time_tags())
 
     def cmd_user(self, user, args):
         if user.registered:
@@ -137,12 +243,151 @@ class Server(object):
             self.respond(user, self.host, ERR_NEEDMOREPARAMS, 
                          ['USER :Not enough parameters'])
         else:
-            user.realname = args[3]
-            if not user.nick == UNSET_NICK:
-                self.register(user, user.nick)
+            user.username = args[0][:self.config.userlen]
+            user.realname = args[3][:self.config.realnamelen]
+            self.try_register(user)
+
+    def try_register(self, user):
+        # registration waits for CAP END while capabilities are negotiated
+        # and for the password check to finish
+        if (user.nick == UNSET_NICK or user.realname is None or
+            user.cap_negotiating or user.checking):
+            return
+
+        if self.config.password is not None and not user.authenticated:
+            self.check_password(user)
+        elif self.users.get(user.nick, user) is not user:
+            # taken by someone who registered while the password was checked
+            self.respond(user, self.host, ERR_NICKNAMEINUSE,
+                         [user.nick, ':Nickname is already in use'])
+        else:
+            self.register(user, user.nick)
+
+    def check_password(self, user):
+        password, user.password = user.password, None
+        if password is None:
+            self.password_rejected(user)
+            return
+
+        user.checking = True
+        d = self.checker.check(password, self.config.password)
+        d.addCallback(self.password_checked, user)
+
+    def password_checked(self, ok, user):
+        if not user.checking:
+            # the connection closed while the password was checked
+            return
+        user.checking = False
+
+        if ok:
+            user.authenticated = True
+            self.try_register(user)
+        else:
+            self.password_rejected(user)
+
+    def password_rejected(self, user):
+        self.respond(user, self.host, ERR_PASSWDMISMATCH,
+                     [':Password incorrect'])
+        user.close()
+
+    def cmd_oper(self, user, args):
+        if len(args) < 2:
+            self.respond(user, self.host, ERR_NEEDMOREPARAMS,
+                         ['OPER :Not enough parameters'])
+            return
+
+        if user.checking:
+            # one password check at a time per user keeps a client from
+            # filling the check pool with OPER attempts
+            return
+
+        hashed = self.config.opers.get(args[0].lower())
+        if hashed is None:
+            self.respond(user, self.host, ERR_PASSWDMISMATCH,
+                         [':Password incorrect'])
+            return
+        user.checking = True
+        d = self.checker.check(args[1], hashed)
+        d.addCallback(self.oper_checked, user)
+
+    def oper_checked(self, ok, user):
+        if not user.checking:
+            # the connection closed while the password was checked
+            return
+        user.checking = False
+
+        if ok:
+            user.oper = True
+            self.opers.add(user)
+            self.respond(user, self.host, RPL_YOUREOPER,
+                         [':You are now an IRC operator'])
+        else:
+            self.respond(user, self.host, ERR_PASSWDMISMATCH,
+                         [':Password incorrect'])
+
+    def cmd_cap(self, user, args):
+        subcommand = args[0].upper() if args else ''
+        if subcommand in ('LS', 'REQ') and not user.registered:
+            user.cap_negotiating = True
+
+        if subcommand == 'LS':
+            self.respond(user, self.host, 'CAP',
+                         ['LS', ':' + ' '.join(CAPABILITIES)])
+        elif subcommand == 'LIST':
+            self.respond(user, self.host, 'CAP',
+                         ['LIST', ':' + ' '.join(sorted(user.caps))])
+        elif subcommand == 'REQ':
+            requested = ' '.join(args[1].split()) if len(args) > 1 else ''
+            changes = parse_caps(requested)
+            # a request is applied entirely or not at all
+            if changes and all(name in CAPABILITIES for name, on in changes):
+                caps = set(user.caps)
+                for name, on in changes:
+                    if on:
+                        caps.add(name)
+                    else:
+                        caps.discard(name)
+                user.caps = frozenset(caps)
+                self.respond(user, self.host, 'CAP', ['ACK', ':' + requested])
+            else:
+                self.respond(user, self.host, 'CAP', ['NAK', ':' + requested])
+        elif subcommand == 'END':
+            if user.cap_negotiating:
+                user.cap_negotiating = False
+                self.try_register(user)
+        else:
+            self.respond(user, self.host, ERR_INVALIDCAPCMD,
+                         [subcommand or '*', ':Invalid CAP command'])
     
     def cmd_quit(self, user, args):
-        pass
+        message = args[0] if args else 'Client Quit'
+        self.quit(user, message)
+        user.close()
+
+    def connection_lost(self, user):
+        self.quit(user, 'Connection closed')
+        self.throttle.disconnected(user)
+        if self.recorder is not None:
+            self.recorder.closed(user)
+
+    def quit(self, user, message):
+        self.scheduler.remove(user)
+        user.checking = False
+
+        self.broadcast(self.notify_set(user),
+                       ':{} QUIT :{}'.format(user.nick, message), user,
+                       self.time_tags())
+
+        for c in list(user.channels):
+            self.leave_channel(user, c)
+        self.opers.discard(user)
+        for c in self.invited.pop(user, ()):
+            c.invites.pop(user, None)
+
+        if user.registered:
+            self.whowas.add(user.nick, user)
+            self.users.remove(user)
+            user.registered = False
 
     def cmd_join(self, user, args):
         if args == []:
@@ -152,34 +397,58 @@ class Server(object):
             name = args[0]
 
             if name == '0':
-                for u in self.notify_set(user):
-                    self.respond_without_nick(u, user.nick, 'PART', ['{}'.format(name)])
-
-                for c in user.channels:
-                    c.users.remove(user)
+                self.broadcast(self.notify_set(user),
+                               ':{} PART {}'.format(user.nick, name),
+                               tags=self.time_tags())
 
-                user.channels = []
+                for c in list(user.channels):
+                    self.leave_channel(user, c)
 
             elif not self.valid_chan(name):
                 self.respond(user, self.host, ERR_NOSUCHCHANNEL,
                              [name, ':No such channel'])
             else:
-                if not name in self.channels:
-                    self.channels[name] = Channel(name)
+                # a channel only exists while it has members
+                chan = self.channels.get(name)
+                if chan is None:
+                    chan = Channel(name)
+                elif chan in user.channels:
+                    # ignore a user's attempt to join a channel of
+                    # which they are already a part
+                    return
 
-                chan = self.channels[name]
-                if not chan in user.channels:
-                    user.channels.append(chan)
-                    chan.users.append(user)
+                if len(user.channels) >= self.config.max_channels:
+                    self.respond(user, self.host, ERR_TOOMANYCHANNELS,
+                                 [name, ':You have joined too many channels'])
+                    return
+
+                key = args[1] if len(args) > 1 else None
+                error = self.join_error(user, chan, key)
+                if error:
+                    self.respond(user, self.host, error[0],
+                                 [name, error[1]])
+                else:
+                    self.join_channel(user, chan)
 
-                    for u in chan.users:
-                        self.respond_without_nick(u, user.nick, 'JOIN', ['{}'.format(name)])
+                    self.broadcast(chan.users,
+                                   ':{} JOIN {}'.format(user.nick, chan.name),
+                                   tags=self.time_tags())
 
                     self.send_names(user, chan)
-                else:
-                    # ignore a user's attempt to join a channel of
-                    # which they are already a part
-                    pass
+
+    def join_error(self, user, chan, key):
+        hostmask = self.hostmask(user)
+        if chan.key is not None and key != chan.key:
+            return ERR_BADCHANNELKEY, ':Cannot join channel (+k)'
+        if chan.limit is not None and len(chan.users) >= chan.limit:
+            return ERR_CHANNELISFULL, ':Cannot join channel (+l)'
+        if ('i' in chan.modes and
+            not chan.is_invited(user, self.clock.seconds()) and
+            not chan.matches('I', hostmask)):
+            return ERR_INVITEONLYCHAN, ':Cannot join channel (+i)'
+        if chan.is_banned(hostmask):
+            return ERR_BANNEDFROMCHAN, ':Cannot join channel (+b)'
+        return None
 
     def cmd_part(self, user, args):
         if args == []:
@@ -194,58 +463,699 @@ class Server(object):
             else:
                 chan = self.channels[name]
                 if chan in user.channels:
-                    user.channels.remove(chan)
-
-                    for u in chan.users:
-                        self.respond_without_nick(u, user.nick, 'PART', ['{}'.format(name)])
-                    chan.users.remove(user)
+                    self.broadcast(chan.users,
+                                   ':{} PART {}'.format(user.nick, chan.name),
+                                   tags=self.time_tags())
+                    self.leave_channel(user, chan)
                 else:
                     self.respond(user, self.host, ERR_NOTONCHANNEL,
                                  [name, ":You're not on that channel"])
 
+    def join_channel(self, user, chan):
+        user.channels.append(chan)
+        chan.add_user(user)
+        if len(chan.users) == 1:
+            self.channels.add(chan)
+            self.channel_count += 1
+
+    def leave_channel(self, user, chan):
+        # the last member out takes the channel, its modes and its
+        # history with them
+        user.channels.remove(chan)
+        chan.remove_user(user)
+        if not chan.users:
+            self.channels.remove(chan)
+            self.history.remove(chan)
+            self.channel_count -= 1
+
     def cmd_list(self, user, args):
         pass
         
     def cmd_kick(self, user, args):
-        pass
+        if len(args) < 2:
+            self.respond(user, self.host, ERR_NEEDMOREPARAMS,
+                         ['KICK :Not enough parameters'])
+            return
+
+        name = args[0]
+        chan = self.channels.get(name)
+        if chan is None:
+            self.respond(user, self.host, ERR_NOSUCHCHANNEL,
+                         [name, ':No such channel'])
+        elif not chan.has_user(user):
+            self.respond(user, self.host, ERR_NOTONCHANNEL,
+                         [name, ":You're not on that channel"])
+        elif not user in chan.ops:
+            self.respond(user, self.host, ERR_CHANOPRIVSNEEDED,
+                         [name, ":You're not channel operator"])
+        else:
+            reason = args[2] if len(args) > 2 else user.nick
+            for nick in args[1].split(',')[:self.config.targmax]:
+                target = self.users.get(nick)
+                if target is None or not chan.has_user(target):
+                    self.respond(user, self.host, ERR_USERNOTINCHANNEL,
+                                 [nick, name, ":They aren't on that channel"])
+                    continue
+                self.broadcast(chan.users, ':{} KICK {} {} :{}'.format(
+                                   user.nick, name, target.nick, reason),
+                               tags=self.time_tags())
+                self.leave_channel(target, chan)
+
+    def cmd_invite(self, user, args):
+        if len(args) < 2:
+            self.respond(user, self.host, ERR_NEEDMOREPARAMS,
+                         ['INVITE :Not enough parameters'])
+            return
+
+        nick, name = args[0], args[1]
+        target = self.users.get(nick)
+        chan = self.channels.get(name)
+        if target is None:
+            self.respond(user, self.host, ERR_NOSUCHNICK,
+                         [nick, ':No such nick/channel'])
+            return
+        if chan is not None:
+            if not chan.has_user(user):
+                self.respond(user, self.host, ERR_NOTONCHANNEL,
+                             [name, ":You're not on that channel"])
+                return
+            if chan.has_user(target):
+                self.respond(user, self.host, ERR_USERONCHANNEL,
+                             [target.nick, name, ':is already on channel'])
+                return
+            if 'i' in chan.modes and not user in chan.ops:
+                self.respond(user, self.host, ERR_CHANOPRIVSNEEDED,
+                             [name, ":You're not channel operator"])
+                return
+            chan.invite(target,
+                        self.clock.seconds() + self.config.invite_expiry)
+            self.invited.setdefault(target, set()).add(chan)
+
+        self.respond(user, self.host, RPL_INVITING, [target.nick, name])
+        if target.away is not None:
+            self.respond(user, self.host, RPL_AWAY,
+                         [target.nick, ':' + target.away])
+        self.broadcast([target], ':{} INVITE {} {}'.format(
+                           user.nick, target.nick, name),
+                       tags=self.time_tags())
+
+    def cmd_away(self, user, args):
+        if args and args[0]:
+            user.away = args[0]
+            self.respond(user, self.host, RPL_NOWAWAY,
+                         [':You have been marked as being away'])
+        else:
+            user.away = None
+            self.respond(user, self.host, RPL_UNAWAY,
+                         [':You are no longer marked as being away'])
     
     def cmd_privmsg(self, user, args):
+        self.message(user, 'PRIVMSG', args)
+
+    def cmd_notice(self, user, args):
+        self.message(user, 'NOTICE', args)
+
+    def message(self, user, command, args):
+        # NOTICE never generates automatic replies
+        notice = command == 'NOTICE'
+
         if args == []:
-            self.respond(user, self.host, ERR_NORECIPIENT, 
-                         [':No recipient given (PRIVMSG)'])
+            if not notice:
+                self.respond(user, self.host, ERR_NORECIPIENT,
+                             [':No recipient given ({})'.format(command)])
         elif len(args) == 1:
-            self.respond(user, self.host, ERR_NOTEXTTOSEND,
-                         [':No text to send'])
+            if not notice:
+                self.respond(user, self.host, ERR_NOTEXTTOSEND,
+                             [':No text to send'])
         else:
-            target = args[0]
+            targets = args[0].split(',')
             message = args[1]
 
-            if not target in self.users and not target in self.channels:
+            if len(targets) > self.config.targmax:
+                if not notice:
+                    self.respond(user, self.host, ERR_TOOMANYTARGETS,
+                                 [args[0], ':Too many recipients'])
+                return
+
+            for target in targets:
+                self.message_target(user, command, target, message, notice)
+
+    def message_target(self, user, command, target, message, notice):
+        recipient = self.users.get(target)
+        if recipient is None and not target in self.channels:
+            if not notice:
                 self.respond(user, self.host, ERR_NOSUCHNICK,
                              [target, ':No such nick/channel'])
-            else:
-                if target in self.users:
-                    self.respond(self.users[target], user.nick, 'PRIVMSG',
-                                 [':{}'.format(message)])
-                else:
-                    for u in self.channels[target].users:
-                        if not user == u:
-                            self.respond_without_nick(u, user.nick, 'PRIVMSG',
-                                                      [target,
-                                                       ':{}'.format(message)])
-                            
-    def cmd_notice(self, user, args):
-        pass
+        elif recipient is not None:
+            if recipient.away is not None and not notice:
+                self.respond(user, self.host, RPL_AWAY,
+                             [recipient.nick, ':' + recipient.away])
+            recipients = [recipient]
+            if 'echo-message' in user.caps and recipient is not user:
+                recipients.append(user)
+            self.broadcast(recipients, ':{} {} {} :{}'.format(
+                               user.nick, command, recipient.nick, message),
+                           tags=self.time_tags())
+        else:
+            chan = self.channels[target]
+            if not self.can_send(user, chan):
+                if not notice:
+                    self.respond(user, self.host, ERR_CANNOTSENDTOCHAN,
+                                 [target, ':Cannot send to channel'])
+                return
+
+            line = ':{} {} {} :{}'.format(user.nick, command, chan.name,
+                                          message)
+            entry = self.history.add(chan, line, self.clock.seconds())
+            exclude = None if 'echo-message' in user.caps else user
+            self.broadcast(chan.users, line, exclude, entry.tags)
+
+    def can_send(self, user, chan):
+        if not chan.has_user(user):
+            return 'n' not in chan.modes and 'm' not in chan.modes
+        if user in chan.ops or user in chan.voiced:
+            return True
+        if 'm' in chan.modes:
+            return False
+        return not chan.member_banned(user, self.hostmask(user))
 
     def cmd_topic(self, user, args):
         pass
 
+    def cmd_motd(self, user, args):
+        self.send_motd(user)
+
+    def cache_motd(self):
+        # Every MOTD reply is the same apart from the nick, so the text on
+        # either side of it is formatted once per configuration
+        self.motd_source = self.config.motd
+
+        def reply(code, text):
+            return ':{} {} '.format(self.host, code), ' :' + text
+
+        if not self.config.motd:
+            self.motd = [reply(ERR_NOMOTD, 'MOTD File is missing')]
+            return
+
+        self.motd = [reply(RPL_MOTDSTART,
+                           '- {} Message of the day - '.format(self.host))]
+        for line in self.config.motd:
+            self.motd.append(reply(RPL_MOTD, '- ' + line))
+        self.motd.append(reply(RPL_ENDOFMOTD, 'End of MOTD command'))
+
+    def send_motd(self, user):
+        if self.motd_source is not self.config.motd:
+            self.cache_motd()
+        for head, tail in self.motd:
+            user.send(head + user.nick + tail)
+        self.sent += len(self.motd)
+
+    def cmd_lusers(self, user, args):
+        self.send_lusers(user)
+
+    def send_lusers(self, user):
+        self.respond(user, self.host, RPL_LUSERCLIENT,
+                     [':There are {} users and 0 services on 1 '
+                      'servers'.format(len(self.users))])
+        if self.opers:
+            self.respond(user, self.host, RPL_LUSEROP,
+                         [str(len(self.opers)), ':operator(s) online'])
+        if self.throttle.unregistered:
+            self.respond(user, self.host, RPL_LUSERUNKNOWN,
+                         [str(len(self.throttle.unregistered)),
+                          ':unknown connection(s)'])
+        if self.channel_count:
+            self.respond(user, self.host, RPL_LUSERCHANNELS,
+                         [str(self.channel_count), ':channels formed'])
+        self.respond(user, self.host, RPL_LUSERME,
+                     [':I have {} clients and 0 servers'.format(
+                         len(self.users))])
+
+    def cmd_rehash(self, user, args):
+        if not user.oper:
+            self.respond(user, self.host, ERR_NOPRIVILEGES,
+                         [":Permission Denied- You're not an IRC operator"])
+        elif self.config.path is None:
+            self.respond(user, self.host, ERR_FILEERROR,
+                         [':No configuration file to rehash'])
+        else:
+            self.respond(user, self.host, RPL_REHASHING,
+                         [self.config.path, ':Rehashing'])
+            self.rehash()
+
+    def rehash(self):
+        # The new configuration is swapped in with a single assignment.
+        # Listeners, TLS files, name, host, check_threads, the recording
+        # file and the WHOWAS size are only read at startup.
+        if self.config.path is None:
+            return False
+        try:
+            self.config = load_config(self.config.path)
+        except ConfigError as e:
+            print "Rehash failed, keeping old configuration: {}".format(e)
+            return False
+        self.scheduler.budget = self.config.tick_budget
+        self.throttle.config = self.config
+        self.history.resize(self.config.history_size)
+        self.history.budget = self.config.history_budget
+        self.history.evict()
+        print "Rehashed {}".format(self.config.path)
+        return True
+
+    def cmd_mode(self, user, args):
+        if args == []:
+            self.respond(user, self.host, ERR_NEEDMOREPARAMS,
+                         ['MODE :Not enough parameters'])
+        elif args[0] in self.channels:
+            self.channel_mode(user, self.channels[args[0]], args[1:])
+        elif args[0] in self.users:
+            self.user_mode(user, args[0], args[1:])
+        else:
+            self.respond(user, self.host, ERR_NOSUCHNICK,
+                         [args[0], ':No such nick/channel'])
+
+    def user_mode(self, user, nick, args):
+        if nick != user.nick:
+            self.respond(user, self.host, ERR_USERSDONTMATCH,
+                         [":Can't change mode for other users"])
+        elif args == []:
+            self.respond(user, self.host, RPL_UMODEIS, ['+'])
+        else:
+            # no user modes are supported yet
+            for c in args[0]:
+                if c not in '+-':
+                    self.respond(user, self.host, ERR_UMODEUNKNOWNFLAG,
+                                 [':Unknown MODE flag'])
+                    break
+
+    def channel_mode(self, user, chan, args):
+        if args == []:
+            self.respond(user, self.host, RPL_CHANNELMODEIS,
+                         [chan.name, chan.mode_string()])
+            return
+
+        params = list(args[1:])
+        sign = '+'
+        applied = []
+        applied_params = []
+        is_op = user in chan.ops
+        denied = False
+
+        for c in args[0]:
+            if c in '+-':
+                sign = c
+            elif c in LIST_MODES:
+                if not params:
+                    self.send_mask_list(user, chan, c)
+                    continue
+                mask = normalize_mask(params.pop(0))
+                if not is_op:
+                    denied = True
+                    continue
+                if sign == '+':
+                    changed = chan.add_mask(c, mask)
+                else:
+                    changed = chan.remove_mask(c, mask)
+                if changed:
+                    applied.append((sign, c))
+                    applied_params.append(mask)
+            elif c in 'ov':
+                if not params:
+                    continue
+                nick = params.pop(0)
+                if not is_op:
+                    denied = True
+                    continue
+                target = self.users.get(nick)
+                if target is None or not chan in target.channels:
+                    self.respond(user, self.host, ERR_USERNOTINCHANNEL,
+                                 [nick, chan.name,
+                                  ":They aren't on that channel"])
+                    continue
+                members = chan.ops if c == 'o' else chan.voiced
+                if sign == '+':
+                    members.add(target)
+                else:
+                    members.discard(target)
+                applied.append((sign, c))
+                applied_params.append(nick)
+            elif c in 'kl' or c in FLAG_MODES:
+                param = None
+                if c == 'k' or (c == 'l' and sign == '+'):
+                    if not params:
+                        continue
+                    param = params.pop(0)
+                if not is_op:
+                    denied = True
+                    continue
+                if c == 'k':
+                    chan.key = param if sign == '+' else None
+                elif c == 'l':
+                    if sign == '+':
+                        try:
+                            chan.limit = int(param)
+                        except ValueError:
+                            continue
+                        param = str(chan.limit)
+                    else:
+                        chan.limit = None
+                elif sign == '+':
+                    chan.modes.add(c)
+                else:
+                    chan.modes.discard(c)
+                applied.append((sign, c))
+                if param is not None:
+                    applied_params.append(param)
+            else:
+                self.respond(user, self.host, ERR_UNKNOWNMODE,
+                             [c, ':is unknown mode char to me for '
+                              '{}'.format(chan.name)])
+
+        if denied:
+            self.respond(user, self.host, ERR_CHANOPRIVSNEEDED,
+                         [chan.name, ":You're not channel operator"])
+
+        if applied:
+            modes = ''
+            last = None
+            for sign, c in applied:
+                if sign != last:
+                    modes += sign
+                    last = sign
+                modes += c
+            self.broadcast(chan.users, ':{} MODE {}'.format(
+                               user.nick,
+                               ' '.join([chan.name, modes] + applied_params)),
+                           tags=self.time_tags())
+
+    def send_mask_list(self, user, chan, mode):
+        reply, end, text = {
+            'b': (RPL_BANLIST, RPL_ENDOFBANLIST, 'End of channel ban list'),
+            'e': (RPL_EXCEPTLIST, RPL_ENDOFEXCEPTLIST,
+                  'End of channel exception list'),
+            'I': (RPL_INVITELIST, RPL_ENDOFINVITELIST,
+                  'End of channel invite list')}[mode]
+        for mask in chan.lists[mode]:
+            self.respond(user, self.host, reply, [chan.name, mask])
+        self.respond(user, self.host, end, [chan.name, ':' + text])
+
+    def stats(self):
+        # unregistered connections all share the nick '*', so their
+        # queues are added up under it
+        queues = {}
+        for u, n in self.scheduler.queue_lengths().iteritems():
+            queues[u.nick] = queues.get(u.nick, 0) + n
+        return {'users': len(self.users),
+                'channels': self.channel_count,
+                'opers': len(self.opers),
+                'unregistered': len(self.throttle.unregistered),
+                'rejected_connections': self.throttle.rejected,
+                'input_queued': self.scheduler.queued(),
+                'slow_commands': self.slow_commands,
+                'password_checks': self.checker.pending,
+                'input_queues': queues}
+
+    def cmd_stats(self, user, args):
+        query = args[0][:1] if args else ''
+        if query == 'q':
+            if not user.oper:
+                self.respond(user, self.host, ERR_NOPRIVILEGES,
+                             [":Permission Denied- You're not an IRC "
+                              "operator"])
+                return
+            queues = self.stats()['input_queues']
+            for nick in sorted(queues):
+                self.respond(user, self.host, RPL_STATSLINKINFO,
+                             [nick, ':{} lines queued'.format(queues[nick])])
+        self.respond(user, self.host, RPL_ENDOFSTATS,
+                     [query or '*', ':End of STATS report'])
+
+    def cmd_profile(self, user, args):
+        if not user.oper:
+            self.respond(user, self.host, ERR_NOPRIVILEGES,
+                         [":Permission Denied- You're not an IRC operator"])
+            return
+
+        if args and args[0].lower() == 'stop':
+            path = self.profiler.stop()
+            if path is None:
+                text = 'The profiler is not running'
+            else:
+                text = 'Wrote profile to {}'.format(path)
+        else:
+            try:
+                seconds = int(args[0]) if args else self.config.profile_seconds
+            except ValueError:
+                self.respond(user, self.host, ERR_NEEDMOREPARAMS,
+                             ['PROFILE :Not enough parameters'])
+                return
+            if self.profiler.start(seconds, self.config.profile_file):
+                text = 'Profiling to {}'.format(self.config.profile_file)
+            else:
+                text = 'The profiler is already running'
+        self.respond(user, self.host, 'NOTICE', [':' + text])
+
+    def toggle_profile(self):
+        if self.profiler.running:
+            self.profiler.stop()
+        else:
+            self.profiler.start(self.config.profile_seconds,
+                                self.config.profile_file)
+
+    # User queries
+
+    def cmd_who(self, user, args):
+        mask = args[0] if args else '*'
+        if mask == '0':
+            mask = '*'
+
+        chan = self.channels.get(mask)
+        if chan is not None:
+            matches = ((chan, u) for u in chan.users)
+        else:
+            matches = ((None, u) for u in self.who_matches(mask))
+
+        count = 0
+        for c, u in matches:
+            if count == self.config.who_replies:
+                break
+            self.send_who_reply(user, c, u)
+            count += 1
+
+        self.respond(user, self.host, RPL_ENDOFWHO,
+                     [mask, ':End of WHO list'])
+
+    def who_matches(self, mask):
+        # Exact nicks, hosts and realnames come straight from the indexes;
+        # only wildcard masks need to look at every user. Anyone can send
+        # WHO, so the mask goes through the linear glob matcher.
+        if not has_wildcards(mask):
+            u = self.users.get(mask)
+            if u is not None:
+                return [u]
+            return self.users.by_host(mask) or self.users.by_realname(mask)
+
+        match = compile_masks([mask])
+        return (u for u in self.users
+                if match(u.nick) or match(u.host) or
+                   match(u.realname or '') or match(self.hostmask(u)))
+
+    def send_who_reply(self, user, chan, target):
+        here = 'H' if target.away is None else 'G'
+        if chan is None:
+            name = target.channels[0].name if target.channels else '*'
+            flags = here
+        else:
+            name = chan.name
+            flags = here + chan.prefix(target)
+        self.respond(user, self.host, RPL_WHOREPLY,
+                     [name, target.username, target.host, self.host,
+                      target.nick, flags,
+                      ':0 {}'.format(target.realname)])
+
+    def cmd_whois(self, user, args):
+        if args == []:
+            self.respond(user, self.host, ERR_NONICKNAMEGIVEN,
+                         [':No nickname given'])
+            return
+
+        for nick in args[-1].split(','):
+            target = self.users.get(nick)
+            if target is None:
+                self.respond(user, self.host, ERR_NOSUCHNICK,
+                             [nick, ':No such nick/channel'])
+                continue
+
+            self.respond(user, self.host, RPL_WHOISUSER,
+                         [target.nick, target.username, target.host, '*',
+                          ':{}'.format(target.realname)])
+            if target.channels:
+                self.respond(user, self.host, RPL_WHOISCHANNELS,
+                             [target.nick,
+                              ':' + ' '.join(c.prefix(target) + c.name
+                                             for c in target.channels)])
+            self.respond(user, self.host, RPL_WHOISSERVER,
+                         [target.nick, self.host, ':{}'.format(self.name)])
+            if target.away is not None:
+                self.respond(user, self.host, RPL_AWAY,
+                             [target.nick, ':' + target.away])
+            self.respond(user, self.host, RPL_ENDOFWHOIS,
+                         [target.nick, ':End of WHOIS list'])
+
+    def cmd_whowas(self, user, args):
+        if args == []:
+            self.respond(user, self.host, ERR_NONICKNAMEGIVEN,
+                         [':No nickname given'])
+            return
+
+        try:
+            count = int(args[1]) if len(args) > 1 else None
+        except ValueError:
+            count = None
+
+        for nick in args[0].split(','):
+            entries = self.whowas.lookup(nick, count)
+            if not entries:
+                self.respond(user, self.host, ERR_WASNOSUCHNICK,
+                             [nick, ':There was no such nickname'])
+            for entry in entries:
+                self.respond(user, self.host, RPL_WHOWASUSER,
+                             [entry.nick, entry.username, entry.host, '*',
+                              ':{}'.format(entry.realname)])
+                self.respond(user, self.host, RPL_WHOISSERVER,
+                             [entry.nick, self.host,
+                              ':{}'.format(self.name)])
+            self.respond(user, self.host, RPL_ENDOFWHOWAS,
+                         [nick, ':End of WHOWAS'])
+
+    def cmd_ison(self, user, args):
+        if args == []:
+            self.respond(user, self.host, ERR_NEEDMOREPARAMS,
+                         ['ISON :Not enough parameters'])
+            return
+
+        online = []
+        for arg in args:
+            for nick in arg.split():
+                target = self.users.get(nick)
+                if target is not None:
+                    online.append(target.nick)
+        self.respond(user, self.host, RPL_ISON, [':' + ' '.join(online)])
+
+    def cmd_userhost(self, user, args):
+        if args == []:
+            self.respond(user, self.host, ERR_NEEDMOREPARAMS,
+                         ['USERHOST :Not enough parameters'])
+            return
+
+        replies = []
+        for nick in args[:MAX_USERHOST_TARGETS]:
+            target = self.users.get(nick)
+            if target is not None:
+                # nick, '*' for an operator, '=', then '-' if away or '+'
+                replies.append('{}{}={}{}@{}'.format(
+                    target.nick, '*' if target.oper else '',
+                    '-' if target.away is not None else '+',
+                    target.username, target.host))
+        self.respond(user, self.host, RPL_USERHOST, [':' + ' '.join(replies)])
+
+    # Channel history
+
+    def cmd_chathistory(self, user, args):
+        if len(args) < 3:
+            self.fail(user, 'CHATHISTORY', 'NEED_MORE_PARAMS',
+                      ['Missing parameters'])
+            return
+
+        subcommand = args[0].upper()
+        target = args[1]
+        chan = self.channels.get(target)
+        if chan is None or not chan in user.channels:
+            self.fail(user, 'CHATHISTORY', 'INVALID_TARGET',
+                      [subcommand, target, 'Messages could not be retrieved'])
+            return
+
+        if subcommand == 'BETWEEN':
+            points = args[2:4]
+            limit = args[4] if len(args) > 4 else None
+        else:
+            points = args[2:3]
+            limit = args[3] if len(args) > 3 else None
+
+        # LATEST may use * to mean no lower bound
+        latest_all = subcommand == 'LATEST' and points == ['*']
+        parsed = [None if latest_all else parse_point(p) for p in points]
+        try:
+            limit = min(int(limit), self.config.history_limit)
+        except (TypeError, ValueError):
+            limit = None
+
+        methods = {'LATEST': 'latest', 'BEFORE': 'before', 'AFTER': 'after',
+                   'AROUND': 'around', 'BETWEEN': 'between'}
+        if (subcommand not in methods or limit is None or
+            len(points) != (2 if subcommand == 'BETWEEN' else 1) or
+            (None in parsed and not latest_all)):
+            self.fail(user, 'CHATHISTORY', 'INVALID_PARAMS',
+                      [subcommand, 'Invalid parameters'])
+            return
+
+        history = self.history.get(chan)
+        entries = getattr(history, methods[subcommand])(*(parsed + [limit]))
+
+        batch = None
+        if 'batch' in user.caps:
+            self.next_batch += 1
+            batch = str(self.next_batch)
+            self.respond_without_nick(user, self.host, 'BATCH',
+                                      ['+' + batch, 'chathistory', chan.name])
+        for entry in entries:
+            tags = entry.tags
+            if batch is not None:
+                tags = (('batch', batch),) + tags
+            user.send(tag_line(entry.line, tags, user.caps))
+            self.sent += 1
+        if batch is not None:
+            self.respond_without_nick(user, self.host, 'BATCH', ['-' + batch])
+
+    def fail(self, user, command, code, args):
+        self.respond_without_nick(user, self.host, 'FAIL',
+                                  [command, code] + args[:-1] +
+                                  [':' + args[-1]])
+
+    def time_tags(self):
+        return (('time', server_time(self.clock.seconds())),)
+
+    def broadcast(self, users, line, exclude=None, tags=()):
+        # The line is formatted once per distinct result: users are grouped
+        # by which of the tags their capabilities ask for, so sets that
+        # differ only in capabilities these tags don't need share a string
+        needs = [TAG_CAPS.get(name, 'message-tags') for name, value in tags]
+        by_caps = {}
+        variants = {}
+        for u in users:
+            if u == exclude:
+                continue
+            caps = u.caps
+            try:
+                variant = by_caps[caps]
+            except KeyError:
+                wanted = tuple(cap in caps for cap in needs)
+                try:
+                    variant = variants[wanted]
+                except KeyError:
+                    variant = variants[wanted] = tag_line(line, tags, caps)
+                by_caps[caps] = variant
+            u.send(variant)
+            self.sent += 1
+        print "send to {} users: {}".format(len(users), line)
+
     def respond(self, user, prefix, command, args):
         message = ':{} {} {}'.format(prefix, command, user.nick)
         if not args == []:
             message = message + ' ' + ' '.join(args)
 
         user.send(message)
+        self.sent += 1
         print "send to {}: {}".format(user.nick, message)
 
     def respond_without_nick(self, user, prefix, command, args):
@@ -254,6 +1164,7 @@ class Server(object):
             message = message + ' ' + ' '.join(args)
 
         user.send(message)
+        self.sent += 1
         print "send to {}: {}".format(user.nick, message)
 
 
@@ -0,0 +1,36 @@
+from caps import tag_line, parse_caps, escape_tag_value
+
+TAGS = (('time', '2026-10-19T12:00:00.000Z'), ('msgid', '7'))
+
+
+def test_tag_line_untagged():
+    assert tag_line('PING', TAGS, frozenset()) == 'PING'
+    assert tag_line('PING', (), frozenset(['server-time'])) == 'PING'
+
+
+def test_tag_line_server_time():
+    assert (tag_line('PING', TAGS, frozenset(['server-time'])) ==
+            '@time=2026-10-19T12:00:00.000Z PING')
+
+
+def test_tag_line_message_tags():
+    assert (tag_line('PING', TAGS, frozenset(['message-tags'])) ==
+            '@msgid=7 PING')
+    assert (tag_line('PING', TAGS, frozenset(['message-tags',
+                                               'server-time'])) ==
+            '@time=2026-10-19T12:00:00.000Z;msgid=7 PING')
+
+
+def test_tag_line_batch():
+    tags = (('batch', '1'),) + TAGS
+    assert tag_line('PING', tags, frozenset(['batch'])) == '@batch=1 PING'
+
+
+def test_escape_tag_value():
+    assert escape_tag_value('a;b c\\') == 'a\\:b\\sc\\\\'
+
+
+def test_parse_caps():
+    assert (parse_caps('server-time -batch') ==
+            [('server-time', True), ('batch', False)])
+    assert parse_caps('') == []
@@ -0,0 +1,95 @@
+from channel import Channel
+
+
+class TestChannel:
+    def setup_method(self, method):
+        self.chan = Channel('&chan')
+        self.user = object()
+
+    def test_first_user_is_op(self):
+        other = object()
+        self.chan.add_user(self.user)
+        self.chan.add_user(other)
+        assert self.user in self.chan.ops
+        assert not other in self.chan.ops
+
+    def test_remove_user(self):
+        users = [object() for _ in range(4)]
+        for u in users:
+            self.chan.add_user(u)
+
+        self.chan.remove_user(users[1])
+        assert sorted(self.chan.users) == sorted([users[0]] + users[2:])
+        assert not self.chan.has_user(users[1])
+
+        self.chan.remove_user(users[3])
+        self.chan.remove_user(users[0])
+        assert self.chan.users == [users[2]]
+        assert self.chan.has_user(users[2])
+        self.chan.remove_user(users[2])
+        assert self.chan.users == []
+
+    def test_invites_expire(self):
+        other = object()
+        self.chan.invite(self.user, 10)
+        self.chan.invite(other, 20)
+        assert self.chan.is_invited(self.user, 5)
+        assert not self.chan.is_invited(self.user, 10)
+        assert self.chan.is_invited(other, 10)
+        assert list(self.chan.invites) == [other]
+
+    def test_invite_own_deadline(self):
+        # a shorter expiry after a rehash puts a sooner deadline behind a
+        # later one
+        other = object()
+        self.chan.invite(other, 20)
+        self.chan.invite(self.user, 10)
+        assert not self.chan.is_invited(self.user, 15)
+        assert self.chan.is_invited(other, 15)
+
+    def test_invite_used_on_join(self):
+        self.chan.invite(self.user, 10)
+        self.chan.add_user(self.user)
+        assert not self.chan.is_invited(self.user, 0)
+
+    def test_masks(self):
+        assert self.chan.add_mask('b', 'shira!*@*')
+        assert not self.chan.add_mask('b', 'shira!*@*')
+        assert self.chan.matches('b', 'shira!stacey@localhost')
+        assert self.chan.matches('b', 'SHIRA!stacey@localhost')
+        assert not self.chan.matches('b', 'santa!stacey@localhost')
+
+        assert self.chan.remove_mask('b', 'shira!*@*')
+        assert not self.chan.remove_mask('b', 'shira!*@*')
+        assert not self.chan.matches('b', 'shira!stacey@localhost')
+
+    def test_mask_special_characters(self):
+        self.chan.add_mask('b', '[a]?!*@*')
+        assert self.chan.matches('b', '[a]b!x@y')
+        assert not self.chan.matches('b', 'ab!x@y')
+
+    def test_exception(self):
+        self.chan.add_mask('b', '*!*@*')
+        self.chan.add_mask('e', 'shira!*@*')
+        assert self.chan.is_banned('santa!stacey@localhost')
+        assert not self.chan.is_banned('shira!stacey@localhost')
+
+    def test_member_ban_cached(self):
+        self.chan.add_user(self.user)
+        self.chan.add_mask('b', 'shira!*@*')
+        assert self.chan.member_banned(self.user, 'shira!stacey@localhost')
+        assert self.chan.member_banned(self.user, 'santa!stacey@localhost')
+
+        self.chan.forget(self.user)
+        assert not self.chan.member_banned(self.user, 'santa!stacey@localhost')
+
+    def test_member_ban_invalidated(self):
+        self.chan.add_user(self.user)
+        assert not self.chan.member_banned(self.user, 'shira!stacey@localhost')
+        self.chan.add_mask('b', 'shira!*@*')
+        assert self.chan.member_banned(self.user, 'shira!stacey@localhost')
+
+    def test_mode_string(self):
+        self.chan.key = 'secret'
+        self.chan.limit = 10
+        assert self.chan.mode_string() == '+ntkl secret 10'
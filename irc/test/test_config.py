@@ -0,0 +1,70 @@
+import pytest
+
+from config import DEFAULT_CONFIG, ConfigError, load_config
+
+
+class TestConfig:
+    def test_defaults(self, tmpdir):
+        path = tmpdir.join('ircd.conf')
+        path.write('')
+        config = load_config(str(path))
+        assert config == DEFAULT_CONFIG._replace(path=str(path))
+
+    def test_options(self, tmpdir):
+        motd = tmpdir.join('motd.txt')
+        motd.write('line one\r\nline two\n')
+        path = tmpdir.join('ircd.conf')
+        path.write('[server]\n'
+                   'name = Test Server\n'
+                   'motd = {}\n'
+                   '[listen]\n'
+                   'port = 7000\n'
+                   '[limits]\n'
+                   'sendq = 1024\n'.format(motd))
+
+        config = load_config(str(path))
+        assert config.name == 'Test Server'
+        assert config.port == 7000
+        assert config.sendq == 1024
+        assert config.motd == ('line one', 'line two')
+
+    def test_opers(self, tmpdir):
+        path = tmpdir.join('ircd.conf')
+        path.write('[opers]\n'
+                   'Admin = pbkdf2_sha256$10$c2FsdA==$ZGlnZXN0\n')
+        config = load_config(str(path))
+        assert config.opers == {'admin': 'pbkdf2_sha256$10$c2FsdA==$ZGlnZXN0'}
+
+    def test_bad_value(self, tmpdir):
+        path = tmpdir.join('ircd.conf')
+        path.write('[limits]\nsendq = lots\n')
+        with pytest.raises(ConfigError):
+            load_config(str(path))
+
+    def test_non_positive_value(self, tmpdir):
+        path = tmpdir.join('ircd.conf')
+        for value in ['0', '-1']:
+            path.write('[connections]\nconnect_rate = {}\n'.format(value))
+            with pytest.raises(ConfigError):
+                load_config(str(path))
+
+    def test_sizes(self, tmpdir):
+        path = tmpdir.join('ircd.conf')
+        for option in ['whowas = 0', 'history_size = -1',
+                       'history_budget = -1']:
+            path.write('[limits]\n{}\n'.format(option))
+            with pytest.raises(ConfigError):
+                load_config(str(path))
+        path.write('[limits]\nwhowas = 1\nhistory_size = 0\n')
+        config = load_config(str(path))
+        assert (config.whowas, config.history_size) == (1, 0)
+
+    def test_missing_file(self, tmpdir):
+        with pytest.raises(ConfigError):
+            load_config(str(tmpdir.join('missing.conf')))
+
+    def test_missing_motd(self, tmpdir):
+        path = tmpdir.join('ircd.conf')
+        path.write('[server]\nmotd = {}\n'.format(tmpdir.join('missing')))
+        with pytest.raises(ConfigError):
+            load_config(str(path))
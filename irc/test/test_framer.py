@@ -0,0 +1,69 @@
+from framer import IRCLineFramer, MAX_LINE_LENGTH, MAX_TAGS_LENGTH
+
+from twisted.test.proto_helpers import StringTransport
+
+
+class Framer(IRCLineFramer):
+    def __init__(self):
+        IRCLineFramer.__init__(self)
+        self.received = []
+
+    def linesReceived(self, lines):
+        self.received.append(lines)
+
+
+class TestIRCLineFramer:
+    def setup_method(self, method):
+        self.framer = Framer()
+        self.transport = StringTransport()
+        self.framer.makeConnection(self.transport)
+
+    def test_batch(self):
+        self.framer.dataReceived('nick shira\r\nuser shira 0 * :Stacey\r\n')
+        assert self.framer.received == [['nick shira',
+                                         'user shira 0 * :Stacey']]
+
+    def test_bare_newline(self):
+        self.framer.dataReceived('nick shira\nuser shira 0 * :Stacey\r\n')
+        assert self.framer.received == [['nick shira',
+                                         'user shira 0 * :Stacey']]
+
+    def test_partial_line(self):
+        self.framer.dataReceived('nick sh')
+        assert self.framer.received == []
+        self.framer.dataReceived('ira\r')
+        assert self.framer.received == []
+        self.framer.dataReceived('\njoin &chan\r\n')
+        assert self.framer.received == [['nick shira', 'join &chan']]
+
+    def test_empty_lines(self):
+        self.framer.dataReceived('\r\n\nnick shira\r\n\r\n')
+        assert self.framer.received == [['nick shira']]
+
+    def test_long_line_truncated(self):
+        self.framer.dataReceived('privmsg &chan :' + 'a' * 1000 + '\r\n')
+        line = self.framer.received[0][0]
+        assert len(line) == MAX_LINE_LENGTH
+        assert line.startswith('privmsg &chan :aaa')
+
+    def test_tags_not_counted(self):
+        tags = '@' + 'a=b;' * 200
+        line = tags + ' privmsg &chan :' + 'a' * 400
+        self.framer.dataReceived(line + '\r\n')
+        assert self.framer.received == [[line]]
+
+    def test_long_tags_dropped(self):
+        tags = '@' + 'a' * MAX_TAGS_LENGTH
+        self.framer.dataReceived(tags + ' privmsg &chan :hi\r\nnick a\r\n')
+        assert self.framer.received == [['nick a']]
+
+    def test_unterminated_line_bounded(self):
+        for i in range(100):
+            self.framer.dataReceived('a' * 1000)
+        assert len(self.framer._buffer) < 10000
+        self.framer.dataReceived('\r\n')
+        assert len(self.framer.received[0][0]) == MAX_LINE_LENGTH
+
+    def test_sendLine(self):
+        self.framer.sendLine('ping')
+        assert self.transport.value() == 'ping\r\n'
@@ -0,0 +1,123 @@
+from history import (ChannelHistory, HistoryStore, HistoryEntry,
+                     ENTRY_OVERHEAD, milliseconds, parse_point,
+                     server_time)
+
+
+def entry(n):
+    return HistoryEntry(n, n * 1000, (('msgid', str(n)),),
+                        ':a PRIVMSG &c :{}'.format(n))
+
+
+class TestChannelHistory:
+    def setup_method(self, method):
+        self.history = ChannelHistory(5)
+        for n in range(1, 8):
+            self.history.append(entry(n))
+
+    def msgids(self, entries):
+        return [e.msgid for e in entries]
+
+    def test_bounded(self):
+        assert len(self.history) == 5
+        assert self.msgids(self.history.entries) == [3, 4, 5, 6, 7]
+
+    def test_bytes(self):
+        assert self.history.bytes == sum(len(e.line) + ENTRY_OVERHEAD
+                                         for e in self.history.entries)
+
+    def test_latest(self):
+        assert self.msgids(self.history.latest(None, 2)) == [6, 7]
+        assert self.msgids(self.history.latest(('msgid', 5), 10)) == [6, 7]
+
+    def test_before_after(self):
+        assert self.msgids(self.history.before(('msgid', 5), 10)) == [3, 4]
+        assert self.msgids(self.history.before(('msgid', 7), 1)) == [6]
+        assert self.msgids(self.history.after(('msgid', 4), 2)) == [5, 6]
+        assert self.msgids(self.history.after(('time', 6500), 2)) == [7]
+
+    def test_around(self):
+        assert self.msgids(self.history.around(('msgid', 5), 3)) == [4, 5, 6]
+        assert self.msgids(self.history.around(('msgid', 3), 3)) == [3, 4, 5]
+
+    def test_between(self):
+        assert self.msgids(self.history.between(('msgid', 3), ('msgid', 7),
+                                                2)) == [4, 5]
+        assert self.msgids(self.history.between(('msgid', 7), ('msgid', 3),
+                                                2)) == [5, 6]
+
+    def test_between_mixed_points(self):
+        history = ChannelHistory(10)
+        for n in range(1, 8):
+            history.append(HistoryEntry(n, 1000 * n, (), 'line'))
+        assert self.msgids(history.between(('msgid', 6), ('time', 3500),
+                                           10)) == [4, 5]
+        assert self.msgids(history.between(('time', 3500), ('msgid', 6),
+                                           10)) == [4, 5]
+
+    def test_keys_follow_entries(self):
+        assert list(self.history.keys['msgid']) == [3, 4, 5, 6, 7]
+        assert list(self.history.keys['time']) == [3000, 4000, 5000, 6000, 7000]
+
+    def test_resize(self):
+        cost = len(entry(1).line) + ENTRY_OVERHEAD
+        assert self.history.resize(3) == 2 * cost
+        assert self.msgids(self.history.entries) == [5, 6, 7]
+        assert list(self.history.keys['msgid']) == [5, 6, 7]
+        self.history.append(entry(8))
+        assert self.msgids(self.history.entries) == [6, 7, 8]
+
+
+class TestHistoryStore:
+    def test_msgids_and_tags(self):
+        store = HistoryStore(10, 10000)
+        first = store.add('a', 'line', 0.5)
+        second = store.add('b', 'line', 1.25)
+        assert (first.msgid, second.msgid) == (1, 2)
+        assert second.tags == (('time', '1970-01-01T00:00:01.250Z'),
+                               ('msgid', '2'))
+
+    def test_budget_evicts_least_recently_used(self):
+        cost = len('line') + ENTRY_OVERHEAD
+        store = HistoryStore(10, cost * 3)
+        store.add('a', 'line', 0)
+        store.add('a', 'line', 0)
+        store.add('b', 'line', 0)
+        store.get('a')
+        store.add('c', 'line', 0)
+
+        assert len(store.get('b')) == 0
+        assert len(store.get('a')) == 2
+        assert store.bytes <= store.budget
+
+    def test_budget_trims_single_channel(self):
+        store = HistoryStore(100, 1000)
+        for n in range(20):
+            store.add('a', 'line', 0)
+        assert store.bytes <= 1000
+        assert 0 < len(store.get('a')) < 20
+
+    def test_resize(self):
+        cost = len('line') + ENTRY_OVERHEAD
+        store = HistoryStore(10, 10000)
+        for n in range(5):
+            store.add('a', 'line', 0)
+        store.add('b', 'line', 0)
+        store.resize(2)
+        assert len(store.get('a')) == 2
+        assert store.bytes == cost * 3
+        store.resize(0)
+        assert store.bytes == 0
+        assert not store.channels
+
+
+def test_parse_point():
+    assert parse_point('msgid=12') == ('msgid', 12)
+    assert parse_point('timestamp=1970-01-01T00:00:01.250Z') == ('time', 1250)
+    assert parse_point('timestamp=1970-01-01T00:00:01Z') == ('time', 1000)
+    assert parse_point('msgid=abc') is None
+    assert parse_point('*') is None
+    assert parse_point('timestamp=1970-01-01T00:00:01.2Z') == ('time', 1200)
+    assert parse_point('timestamp=1970-01-01T00:00:01.x5Z') is None
+    t = 1792413296.789
+    assert parse_point('timestamp=' + server_time(t)) == \
+        ('time', milliseconds(t))
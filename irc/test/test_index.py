@@ -0,0 +1,59 @@
+from index import ChannelIndex, UserIndex
+from channel import Channel
+
+
+class FakeUser(object):
+    def __init__(self, nick, host, realname):
+        self.nick = nick
+        self.host = host
+        self.realname = realname
+
+
+class TestUserIndex:
+    def setup_method(self, method):
+        self.index = UserIndex()
+        self.user = FakeUser('Shira[1]', 'localhost', 'Stacey')
+        self.index.add(self.user)
+
+    def test_nick_folding(self):
+        assert 'shira{1}' in self.index
+        assert self.index.get('SHIRA[1]') is self.user
+        assert self.index.get('santa') is None
+
+    def test_by_host_and_realname(self):
+        other = FakeUser('santa', 'localhost', 'Nick')
+        self.index.add(other)
+        assert self.index.by_host('localhost') == set([self.user, other])
+        assert self.index.by_realname('stacey') == set([self.user])
+        assert self.index.by_host('example.com') == ()
+
+    def test_rename(self):
+        self.user.nick = 'santa'
+        self.index.rename(self.user, 'Shira[1]')
+        assert self.index.get('santa') is self.user
+        assert not 'shira[1]' in self.index
+
+    def test_remove(self):
+        self.index.remove(self.user)
+        assert len(self.index) == 0
+        assert self.index.by_host('localhost') == ()
+        assert self.index.by_realname('stacey') == ()
+
+
+class TestChannelIndex:
+    def setup_method(self, method):
+        self.index = ChannelIndex()
+        self.chan = Channel('#Chan[1]')
+        self.index.add(self.chan)
+
+    def test_name_folding(self):
+        assert '#chan{1}' in self.index
+        assert self.index['#CHAN[1]'] is self.chan
+        assert self.index.get('#chan{1}') is self.chan
+        assert self.index.get('#other') is None
+        assert list(self.index) == [self.chan]
+
+    def test_remove(self):
+        self.index.remove(self.chan)
+        assert len(self.index) == 0
+        assert not '#chan[1]' in self.index
@@ -0,0 +1,37 @@
+from mask import compile_masks, glob_match, irc_lower, normalize_mask
+
+import time
+
+
+def test_glob_match():
+    assert glob_match('*', '')
+    assert glob_match('a*c', 'abbbc')
+    assert glob_match('a?c', 'abc')
+    assert not glob_match('a?c', 'ac')
+    assert glob_match('*!*@host', 'nick!user@host')
+    assert not glob_match('*!*@host', 'nick!user@host2')
+    assert glob_match('a*b*c', 'aXbYbZc')
+    assert not glob_match('a*b*c', 'aXbYbZ')
+    assert glob_match('ab**', 'ab')
+
+def test_glob_match_many_stars():
+    # a backtracking regex takes seconds on this; the glob matcher doesn't
+    start = time.time()
+    assert not glob_match('*a' * 20 + '*b', 'a' * 500)
+    assert time.time() - start < 1
+
+def test_compile_masks():
+    assert compile_masks([]) is None
+    match = compile_masks(['shira!*@*', '*!*@Example.COM'])
+    assert match('SHIRA!stacey@localhost')
+    assert match('santa!nick@example.com')
+    assert not match('santa!nick@localhost')
+    assert compile_masks(['[a]*'])('{A}b')
+
+def test_irc_lower():
+    assert irc_lower('Shira[]\\~') == 'shira{}|^'
+
+def test_normalize_mask():
+    assert normalize_mask('nick') == 'nick!*@*'
+    assert normalize_mask('user@host') == '*!user@host'
+    assert normalize_mask('nick!user') == 'nick!user@*'
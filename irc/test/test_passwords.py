@@ -0,0 +1,92 @@
+from passwords import hash_password, check_password, PasswordChecker
+
+import passwords
+
+import Queue
+
+
+class ThreadReactor(object):
+    # Collects calls from pool threads for the test to run
+    def __init__(self):
+        self.calls = Queue.Queue()
+        self.triggers = []
+
+    def callFromThread(self, f, *args, **kw):
+        self.calls.put((f, args, kw))
+
+    def addSystemEventTrigger(self, *args):
+        self.triggers.append(args)
+
+
+def test_hash_and_check():
+    hashed = hash_password('secret', 10)
+    assert hashed.startswith('pbkdf2_sha256$10$')
+    assert check_password('secret', hashed)
+    assert not check_password('Secret', hashed)
+
+
+def test_salted():
+    assert hash_password('secret', 10) != hash_password('secret', 10)
+
+
+def test_bad_hash():
+    assert not check_password('secret', 'secret')
+    assert not check_password('secret', 'md5$10$c2FsdA==$ZGlnZXN0')
+    assert not check_password('secret', 'pbkdf2_sha256$x$c2FsdA==$ZGlnZXN0')
+
+
+class BrokenBcrypt(object):
+    def checkpw(self, password, hashed):
+        raise ValueError('Invalid salt')
+
+
+def test_malformed_bcrypt_hash(monkeypatch):
+    monkeypatch.setattr(passwords, 'bcrypt', BrokenBcrypt())
+    assert not check_password('secret', '$2b$nonsense')
+
+
+class TestPasswordChecker:
+    def setup_method(self, method):
+        self.hashed = hash_password('secret', 10)
+
+    def test_inline(self):
+        checker = PasswordChecker(None, 0)
+        results = []
+        checker.check('secret', self.hashed).addCallback(results.append)
+        checker.check('wrong', self.hashed).addCallback(results.append)
+        assert results == [True, False]
+        assert checker.pending == 0
+
+    def test_error_is_mismatch(self, monkeypatch):
+        def broken(password, hashed):
+            raise RuntimeError('broken')
+        monkeypatch.setattr(passwords, 'check_password', broken)
+        checker = PasswordChecker(None, 0)
+        results = []
+        checker.check('secret', self.hashed).addCallback(results.append)
+        assert results == [False]
+        assert checker.pending == 0
+
+    def test_inline_until_started(self):
+        checker = PasswordChecker(None, 2)
+        results = []
+        checker.check('secret', self.hashed).addCallback(results.append)
+        assert results == [True]
+
+    def test_thread_pool(self):
+        reactor = ThreadReactor()
+        checker = PasswordChecker(reactor, 2)
+        checker.start()
+        try:
+            results = []
+            d = checker.check('secret', self.hashed)
+            d.addCallback(results.append)
+            assert checker.pending == 1
+
+            f, args, kw = reactor.calls.get(timeout=10)
+            f(*args, **kw)
+            assert results == [True]
+            assert checker.pending == 0
+        finally:
+            checker.pool.stop()
+        assert reactor.triggers == [('during', 'shutdown', checker.pool.stop)]
@@ -0,0 +1,39 @@
+from twisted.internet.task import Clock
+
+from profiler import Profiler, MAX_PROFILE_SECONDS
+
+import pstats
+
+
+class TestProfiler:
+    def setup_method(self, method):
+        self.clock = Clock()
+        self.profiler = Profiler(self.clock)
+
+    def test_stops_after_seconds(self, tmpdir):
+        path = str(tmpdir.join('ircd.prof'))
+        assert self.profiler.start(5, path)
+        assert self.profiler.running
+
+        self.clock.advance(5)
+        assert not self.profiler.running
+        assert pstats.Stats(path).total_calls >= 0
+
+    def test_stop_early(self, tmpdir):
+        path = str(tmpdir.join('ircd.prof'))
+        self.profiler.start(5, path)
+        assert self.profiler.stop() == path
+        assert not self.clock.getDelayedCalls()
+        assert self.profiler.stop() is None
+
+    def test_already_running(self, tmpdir):
+        path = str(tmpdir.join('ircd.prof'))
+        assert self.profiler.start(5, path)
+        assert not self.profiler.start(5, path)
+        self.profiler.stop()
+
+    def test_seconds_capped(self, tmpdir):
+        self.profiler.start(10 ** 6, str(tmpdir.join('ircd.prof')))
+        call, = self.clock.getDelayedCalls()
+        assert call.getTime() == MAX_PROFILE_SECONDS
+        self.profiler.stop()
@@ -0,0 +1,96 @@
+from recorder import TrafficRecorder, read_records, replay
+from server import Server
+from test_server import FakeUser
+
+from StringIO import StringIO
+from twisted.internet.task import Clock
+
+
+class FakeFile(StringIO):
+    def close(self):
+        pass
+
+
+class TestRecorder:
+    def setup_method(self, method):
+        self.f = FakeFile()
+        self.now = [100.0]
+        self.recorder = TrafficRecorder(self.f, clock=lambda: self.now[0])
+
+    def records(self):
+        return list(read_records(StringIO(self.f.getvalue())))
+
+    def test_round_trip(self):
+        a, b = object(), object()
+        self.recorder.record(a, 'nick shira')
+        self.now[0] = 101.5
+        self.recorder.record(b, 'nick santa')
+        self.recorder.closed(a)
+        self.recorder.record(b, 'quit')
+
+        assert self.records() == [(100.0, 0, 'nick shira'),
+                                  (101.5, 1, 'nick santa'),
+                                  (101.5, 0, None),
+                                  (101.5, 1, 'quit')]
+
+    def test_closed_unknown(self):
+        self.recorder.closed(object())
+        assert self.records() == []
+
+    def test_server_records(self):
+        server = Server("TestServer", clock=Clock())
+        server.recorder = self.recorder
+        user = FakeUser()
+        server.msg_received(user, 'nick shira')
+        server.connection_lost(user)
+
+        assert self.records() == [(100.0, 0, 'nick shira'),
+                                  (100.0, 0, None)]
+
+    def test_server_hides_secrets(self):
+        server = Server("TestServer", clock=Clock())
+        server.recorder = self.recorder
+        user = FakeUser()
+        server.msg_received(user, 'PASS hunter2')
+        server.msg_received(user, 'oper admin hunter2')
+
+        assert self.records() == [(100.0, 0, 'pass <hidden>'),
+                                  (100.0, 0, 'oper <hidden>')]
+        assert 'hunter2' not in self.f.getvalue()
+
+
+class TestReplay:
+    def setup_method(self, method):
+        self.server = Server("TestServer", clock=Clock())
+        self.slept = []
+
+    def test_replay(self):
+        records = [(0.0, 0, 'nick shira'),
+                   (0.0, 0, 'user shira 0 * :Stacey'),
+                   (1.0, 1, 'nick santa'),
+                   (1.0, 1, 'user santa 0 * :Santa'),
+                   (2.0, 0, 'join &chan'),
+                   (2.0, 1, 'join &chan'),
+                   (3.0, 0, 'privmsg &chan :hi'),
+                   (4.0, 1, None),
+                   (5.0, 0, 'quit')]
+        stats = replay(records, self.server)
+
+        assert stats.lines == 8
+        assert stats.commands['join'][0] == 2
+        assert stats.sent > 0
+        assert len(self.server.users) == 0
+        assert 'join' in stats.report()
+
+    def test_replay_speed(self):
+        now = [0.0]
+        def sleep(delay):
+            self.slept.append(delay)
+            now[0] += delay
+
+        records = [(10.0, 0, 'nick shira'),
+                   (12.0, 0, 'nick santa'),
+                   (16.0, 0, 'nick shira')]
+        replay(records, self.server, speed=2, clock=lambda: now[0],
+               sleep=sleep)
+        assert self.slept == [1.0, 2.0]
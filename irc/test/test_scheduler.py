@@ -0,0 +1,77 @@
+from scheduler import InputScheduler
+
+from tickclock import TickClock
+
+
+class TestInputScheduler:
+    def setup_method(self, method):
+        self.clock = TickClock()
+        self.handled = []
+        self.scheduler = InputScheduler(self.handle, self.clock, 3)
+
+    def handle(self, user, line):
+        self.handled.append((user, line))
+
+    def test_round_robin(self):
+        self.scheduler.enqueue('a', ['1', '2', '3'])
+        self.scheduler.enqueue('b', ['1'])
+        self.scheduler.enqueue('c', ['1', '2'])
+        self.clock.tick()
+        assert self.handled == [('a', '1'), ('b', '1'), ('c', '1')]
+
+        self.clock.tick()
+        assert self.handled[3:] == [('a', '2'), ('c', '2'), ('a', '3')]
+        assert self.scheduler.queues == {}
+        assert not self.clock.getDelayedCalls()
+
+    def test_budget_per_tick(self):
+        assert self.scheduler.enqueue('a', ['1'] * 10) == 10
+        self.clock.tick()
+        assert len(self.handled) == 3
+        assert self.scheduler.queued() == 7
+        assert self.scheduler.queue_lengths() == {'a': 7}
+        assert len(self.clock.getDelayedCalls()) == 1
+
+    def test_single_call_scheduled(self):
+        self.scheduler.enqueue('a', ['1'])
+        self.scheduler.enqueue('b', ['1'])
+        assert len(self.clock.getDelayedCalls()) == 1
+
+    def test_handler_error(self):
+        def handle(user, line):
+            if line == 'bad':
+                raise IndexError(line)
+            self.handled.append((user, line))
+        self.scheduler.handler = handle
+
+        self.scheduler.enqueue('a', ['bad', '2'])
+        self.scheduler.enqueue('b', ['1'])
+        self.clock.tick()
+        assert self.handled == [('b', '1'), ('a', '2')]
+        assert self.scheduler.queues == {}
+
+    def test_remove(self):
+        self.scheduler.enqueue('a', ['1', '2'])
+        self.scheduler.enqueue('b', ['1'])
+        self.scheduler.remove('a')
+        self.clock.tick()
+        assert self.handled == [('b', '1')]
+
+    def test_remove_and_enqueue_again(self):
+        self.scheduler.enqueue('a', ['1'])
+        self.scheduler.remove('a')
+        self.scheduler.enqueue('a', ['2', '3'])
+        self.scheduler.enqueue('b', ['1', '2'])
+        self.clock.tick()
+        assert self.handled == [('a', '2'), ('b', '1'), ('a', '3')]
+
+    def test_remove_from_handler(self):
+        def handle(user, line):
+            self.handled.append((user, line))
+            self.scheduler.remove(user)
+        self.scheduler.handler = handle
+
+        self.scheduler.enqueue('a', ['quit', 'privmsg'])
+        self.clock.tick()
+        assert self.handled == [('a', 'quit')]
+        assert self.scheduler.queues == {}
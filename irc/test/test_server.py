@@ -1,18 +1,36 @@
 from server import Server
+from config import load_config
+from passwords import hash_password, check_password
 from mock import Mock, call
+from twisted.internet.defer import Deferred
+
+from tickclock import TickClock
 from codes import *
 
+import time
+
 class FakeUser(object):
     def __init__(self):
         self.nick = '*'
         self.registered = False
+        self.username = None
         self.realname = None
+        self.host = 'localhost'
+        self.oper = False
         self.channels = []
+        self.caps = frozenset()
+        self.cap_negotiating = False
+        self.password = None
+        self.checking = False
+        self.authenticated = False
+        self.away = None
         self.send = Mock()
+        self.close = Mock()
         
 class TestServer:
     def setup_method(self, method):
-        self.server = Server("TestServer")
+        self.clock = TickClock()
+        self.server = Server("TestServer", clock=self.clock)
         self.user = FakeUser()
         self.user.nick = '*'
         self.user.registered = False
@@ -34,6 +52,28 @@ class TestServer:
 
     # Server methods
 
+    def test_broadcast_formats_each_variant_once(self, monkeypatch):
+        import server
+        formatted = []
+        def tag_line(line, tags, caps):
+            formatted.append(caps)
+            return real_tag_line(line, tags, caps)
+        real_tag_line = server.tag_line
+        monkeypatch.setattr(server, 'tag_line', tag_line)
+
+        users = [FakeUser() for i in range(4)]
+        users[0].caps = frozenset()
+        users[1].caps = frozenset(['batch'])
+        users[2].caps = frozenset(['server-time'])
+        users[3].caps = frozenset(['server-time', 'echo-message'])
+        tags = (('time', '2026-10-19T12:00:00.000Z'),)
+        self.server.broadcast(users, 'PING', tags=tags)
+
+        assert len(formatted) == 2
+        assert [u.send.call_args[0][0] for u in users] == [
+            'PING', 'PING', '@time=2026-10-19T12:00:00.000Z PING',
+            '@time=2026-10-19T12:00:00.000Z PING']
+
     def test_parse(self):
         assert (self.server.parse_msg(':prefix command arg1 arg2 :trailing arg') ==
                 ('prefix', 'command', ['arg1', 'arg2', 'trailing arg']))
@@ -45,6 +85,92 @@ class TestServer:
                 ('prefix', 'command', []))
         assert (self.server.parse_msg(':PREFIX COMMAND ARG1 :TRAILING arg') ==
                 ('PREFIX', 'command', ['ARG1', 'TRAILING arg']))
+        assert (self.server.parse_msg('privmsg &chan :hi :) a:b') ==
+                ('', 'privmsg', ['&chan', 'hi :) a:b']))
+        assert (self.server.parse_msg('command a=1:2 :trailing') ==
+                ('', 'command', ['a=1:2', 'trailing']))
+        assert (self.server.parse_msg('@+draft/x=1 :p cmd arg') ==
+                ('p', 'cmd', ['arg']))
+        assert (self.server.parse_msg('@a=1  cmd  arg') ==
+                ('', 'cmd', ['arg']))
+
+    def test_parse_no_command(self):
+        for line in ['', ' ', '@tag', '@tag ', ':prefix', ':prefix ',
+                     '@tag :prefix']:
+            assert self.server.parse_msg(line) is None
+
+    def test_no_command_ignored(self):
+        self.register_user(self.user, 'shira')
+        self.user.send.reset_mock()
+        for line in ['@x', ' ', ':prefix']:
+            self.server.msg_received(self.user, line)
+        assert not self.user.send.called
+
+    def test_lines_received(self):
+        self.server.lines_received(self.user, ['nick shira',
+                                               'user shira 0 * :Stacey'])
+        assert not self.user.registered
+        self.clock.tick()
+        assert self.user.registered
+
+    def test_lines_received_fair(self):
+        users = self.setup_channel('&chan', 2)
+        self.server.scheduler.budget = 2
+        users['foo0'].send.reset_mock()
+
+        self.server.lines_received(users['foo0'], ['privmsg foo1 :a'] * 5)
+        self.server.lines_received(users['foo1'], ['privmsg foo0 :b'])
+        self.clock.tick()
+
+        assert users['foo1'].send.call_count == 1
+        users['foo0'].send.assert_called_once_with(':foo1 PRIVMSG foo0 :b')
+
+        self.clock.tick()
+        self.clock.tick()
+        assert users['foo1'].send.call_count == 5
+
+    def test_excess_flood(self):
+        self.server.config = self.server.config._replace(flood_lines=2)
+        users = self.setup_channel('&chan', 2)
+
+        self.server.lines_received(users['foo0'], ['privmsg foo1 :a'] * 3)
+        assert users['foo0'].close.called
+        assert not 'foo0' in self.server.users
+        users['foo1'].send.assert_called_with(':foo0 QUIT :Excess Flood')
+
+        self.clock.tick()
+        users['foo1'].send.assert_called_with(':foo0 QUIT :Excess Flood')
+
+    def test_stats(self):
+        users = self.setup_channel('&chan', 2)
+        self.server.lines_received(users['foo0'], ['privmsg foo1 :a'] * 2)
+
+        stats = self.server.stats()
+        assert stats['users'] == 2
+        assert stats['channels'] == 1
+        assert stats['input_queued'] == 2
+        assert stats['input_queues'] == {'foo0': 2}
+
+    def test_stats_unregistered_queues(self):
+        self.setup_channel('&chan', 1)
+        for i in range(3):
+            self.server.lines_received(FakeUser(), ['nick a', 'user a'])
+
+        assert self.server.stats()['input_queues'] == {'*': 6}
+
+    def test_stats_queues(self):
+        users = self.setup_channel('&chan', 1)
+        self.server.lines_received(users['foo0'], ['privmsg foo0 :a'] * 2)
+        self.register_user(self.user, 'shira')
+        self.user.oper = True
+        self.user.send.reset_mock()
+
+        self.server.msg_received(self.user, 'stats q')
+        calls = [call(':{} {} shira foo0 :2 lines queued'.format(
+                     self.server.host, RPL_STATSLINKINFO)),
+                 call(':{} {} shira q :End of STATS report'.format(
+                     self.server.host, RPL_ENDOFSTATS))]
+        self.user.send.assert_has_calls(calls)
 
     def test_valid_nick(self):
         assert self.server.valid_nick('s')
@@ -67,12 +193,17 @@ class TestServer:
         for c in non_initial:
             assert not self.server.valid_nick(c + 'a')
 
+        assert not self.server.valid_nick('')
+        assert not self.server.valid_nick('abc!!')
+        assert not self.server.valid_nick('abc def')
+        assert not self.server.valid_nick('abcdefghij')
+
     def test_valid_chan(self):
 
         assert self.server.valid_chan('&chan')
-        assert not self.server.valid_chan('#chan')
-        assert not self.server.valid_chan('!chan')
-        assert not self.server.valid_chan('+chan')
+        assert self.server.valid_chan('#chan')
+        assert self.server.valid_chan('!chan')
+        assert self.server.valid_chan('+chan')
         assert not self.server.valid_chan('chan')
         assert not self.server.valid_chan('#')
         assert not self.server.valid_chan('&')
@@ -86,6 +217,114 @@ class TestServer:
         assert not self.server.valid_chan('&abc,def')
         assert not self.server.valid_chan('&abc:def')
         assert not self.server.valid_chan('&abc\x07def')
+        assert not self.server.valid_chan('&abc\x00def')
+
+    def test_chantypes(self):
+        self.server.config = self.server.config._replace(chantypes='#',
+                                                         channellen=5)
+        assert self.server.valid_chan('#chan')
+        assert not self.server.valid_chan('&chan')
+        assert not self.server.valid_chan('#chann')
+
+    def test_connection_throttle(self):
+        self.server.throttle.connected(self.user)
+        assert self.server.stats()['unregistered'] == 1
+
+        self.register_user(self.user, 'shira')
+        assert self.server.stats()['unregistered'] == 0
+
+        self.server.connection_lost(self.user)
+        assert self.server.throttle.per_ip == {}
+
+    def test_slow_command(self):
+        users = self.setup_channel('&chan', 3)
+        times = iter([0.0, 0.2])
+        self.server.timer = lambda: next(times)
+        self.server.msg_received(users['foo0'], 'privmsg &chan :hi')
+        assert self.server.stats()['slow_commands'] == 1
+
+    def test_fast_command(self):
+        self.server.timer = lambda: 0.0
+        self.register_user(self.user, 'shira')
+        assert self.server.stats()['slow_commands'] == 0
+
+    def test_profile_not_oper(self):
+        self.register_user(self.user, 'shira')
+        self.server.msg_received(self.user, 'profile 5')
+        self.user.send.assert_called_with(':{} {} shira :Permission Denied- '
+            "You're not an IRC operator".format(self.server.host,
+                                                ERR_NOPRIVILEGES))
+        assert not self.server.profiler.running
+
+    def test_profile(self, tmpdir):
+        path = str(tmpdir.join('ircd.prof'))
+        self.server.config = self.server.config._replace(profile_file=path)
+        self.register_user(self.user, 'shira')
+        self.user.oper = True
+
+        self.server.msg_received(self.user, 'profile 5')
+        self.user.send.assert_called_with(':{} NOTICE shira :Profiling to '
+            '{}'.format(self.server.host, path))
+        assert self.server.profiler.running
+
+        self.server.msg_received(self.user, 'profile stop')
+        self.user.send.assert_called_with(':{} NOTICE shira :Wrote profile '
+            'to {}'.format(self.server.host, path))
+        assert tmpdir.join('ircd.prof').check()
+
+    def test_toggle_profile(self, tmpdir):
+        path = str(tmpdir.join('ircd.prof'))
+        self.server.config = self.server.config._replace(profile_file=path)
+        self.server.toggle_profile()
+        assert self.server.profiler.running
+        self.server.toggle_profile()
+        assert not self.server.profiler.running
+
+    # Cap command
+
+    def test_cap_ls_pauses_registration(self):
+        self.server.msg_received(self.user, 'cap ls 302')
+        self.user.send.assert_called_with(':{} CAP * LS :batch echo-message '
+            'message-tags server-time'.format(self.server.host))
+
+        self.server.msg_received(self.user, 'nick shira')
+        self.server.msg_received(self.user, 'user shira 0 * :Shira')
+        assert not self.user.registered
+
+        self.server.msg_received(self.user, 'cap end')
+        assert self.user.registered
+        self.user.send.assert_any_call(':{} {} shira :Welcome to the IRC '
+            'Chat Server shira'.format(self.server.host, RPL_WELCOME))
+
+    def test_cap_req(self):
+        self.server.msg_received(self.user, 'cap req :server-time batch')
+        self.user.send.assert_called_with(':{} CAP * ACK :server-time '
+            'batch'.format(self.server.host))
+        assert self.user.caps == frozenset(['server-time', 'batch'])
+
+        self.server.msg_received(self.user, 'cap req :-batch')
+        assert self.user.caps == frozenset(['server-time'])
+
+        self.server.msg_received(self.user, 'cap list')
+        self.user.send.assert_called_with(':{} CAP * LIST '
+            ':server-time'.format(self.server.host))
+
+    def test_cap_req_unknown(self):
+        self.server.msg_received(self.user, 'cap req :server-time sasl')
+        self.user.send.assert_called_with(':{} CAP * NAK :server-time '
+            'sasl'.format(self.server.host))
+        assert self.user.caps == frozenset()
+
+    def test_cap_invalid(self):
+        self.server.msg_received(self.user, 'cap foo')
+        self.user.send.assert_called_with(':{} {} * FOO :Invalid CAP '
+            'command'.format(self.server.host, ERR_INVALIDCAPCMD))
+
+    def test_cap_after_registration(self):
+        self.register_user(self.user, 'shira')
+        self.server.msg_received(self.user, 'cap req :server-time')
+        assert self.user.caps == frozenset(['server-time'])
+        assert not self.user.cap_negotiating
 
     # Nick command (before registration)
 
@@ -158,12 +397,162 @@ class TestServer:
         self.user.send.assert_called_with(':{} {} shira :You may not '
             'reregister'.format(self.server.host, ERR_ALREADYREGISTERED))
 
+    # Connection password and Oper command
+
+    def setup_password(self):
+        self.server.config = self.server.config._replace(
+            password=hash_password('password', 10),
+            opers={'admin': hash_password('operpass', 10)})
+        self.checks = []
+        self.server.checker.check = self.deferred_check
+
+    def deferred_check(self, password, hashed):
+        d = Deferred()
+        self.checks.append((d, check_password(password, hashed)))
+        return d
+
+    def finish_checks(self):
+        checks, self.checks = self.checks, []
+        for d, result in checks:
+            d.callback(result)
+
+    def test_password(self):
+        self.setup_password()
+        self.register_user(self.user, 'shira')
+        assert not self.user.registered
+        assert self.user.checking
+
+        self.finish_checks()
+        assert self.user.registered
+        assert not self.user.checking
+
+    def test_password_wrong(self):
+        self.setup_password()
+        self.server.msg_received(self.user, 'pass wrong')
+        self.server.msg_received(self.user, 'nick shira')
+        self.server.msg_received(self.user, 'user shira 0 * :shira')
+        self.finish_checks()
+
+        assert not self.user.registered
+        self.user.send.assert_called_with(':{} {} shira :Password '
+            'incorrect'.format(self.server.host, ERR_PASSWDMISMATCH))
+        assert self.user.close.called
+
+    def test_password_missing(self):
+        self.setup_password()
+        self.server.msg_received(self.user, 'nick shira')
+        self.server.msg_received(self.user, 'user shira 0 * :shira')
+
+        assert not self.checks
+        assert not self.user.registered
+        assert self.user.close.called
+
+    def test_password_quit_while_checking(self):
+        self.setup_password()
+        self.register_user(self.user, 'shira')
+        self.server.connection_lost(self.user)
+        self.finish_checks()
+        assert not self.user.registered
+        assert 'shira' not in self.server.users
+
+    def test_password_nick_taken_while_checking(self):
+        self.setup_password()
+        self.register_user(self.user, 'shira')
+        other = FakeUser()
+        self.register_user(other, 'shira')
+        self.checks.pop()[0].callback(True)
+        self.finish_checks()
+
+        assert other.registered
+        assert not self.user.registered
+        self.user.send.assert_called_with(':{} {} shira shira :Nickname is '
+            'already in use'.format(self.server.host, ERR_NICKNAMEINUSE))
+
+        self.server.msg_received(self.user, 'nick santa')
+        assert self.user.registered
+
+    def test_oper(self):
+        self.setup_password()
+        self.register_user(self.user, 'shira')
+        self.finish_checks()
+
+        self.server.msg_received(self.user, 'oper Admin operpass')
+        assert not self.user.oper
+        self.finish_checks()
+        assert self.user.oper
+        self.user.send.assert_called_with(':{} {} shira :You are now an IRC '
+            'operator'.format(self.server.host, RPL_YOUREOPER))
+
+    def test_oper_wrong(self):
+        self.setup_password()
+        self.register_user(self.user, 'shira')
+        self.finish_checks()
+
+        self.server.msg_received(self.user, 'oper admin wrong')
+        self.finish_checks()
+        assert not self.user.oper
+        self.user.send.assert_called_with(':{} {} shira :Password '
+            'incorrect'.format(self.server.host, ERR_PASSWDMISMATCH))
+
+        self.server.msg_received(self.user, 'oper nobody wrong')
+        assert not self.checks
+        assert not self.user.oper
+
+    def test_oper_one_check_at_a_time(self):
+        self.setup_password()
+        self.register_user(self.user, 'shira')
+        self.finish_checks()
+
+        for i in range(5):
+            self.server.msg_received(self.user, 'oper admin wrong')
+        assert len(self.checks) == 1
+        self.finish_checks()
+
+        self.server.msg_received(self.user, 'oper admin operpass')
+        assert len(self.checks) == 1
+        self.finish_checks()
+        assert self.user.oper
+
+    def test_oper_broken_hash(self):
+        self.server.config = self.server.config._replace(
+            opers={'admin': '$2b$nonsense'})
+        self.register_user(self.user, 'shira')
+        for i in range(2):
+            self.user.send.reset_mock()
+            self.server.msg_received(self.user, 'oper admin operpass')
+            self.user.send.assert_called_with(':{} {} shira :Password '
+                'incorrect'.format(self.server.host, ERR_PASSWDMISMATCH))
+        assert not self.user.checking
+
+    def test_oper_quit_while_checking(self):
+        self.setup_password()
+        self.register_user(self.user, 'shira')
+        self.finish_checks()
+
+        self.server.msg_received(self.user, 'oper admin operpass')
+        self.server.connection_lost(self.user)
+        self.finish_checks()
+        assert not self.user.oper
+        assert self.server.stats()['opers'] == 0
+
+    def test_oper_noargs(self):
+        self.register_user(self.user, 'shira')
+        self.server.msg_received(self.user, 'oper admin')
+        self.user.send.assert_called_with(':{} {} shira OPER :Not enough '
+            'parameters'.format(self.server.host, ERR_NEEDMOREPARAMS))
+
     # User command
 
     def test_user(self):
         self.server.msg_received(self.user, 'user shira 0 * :Stacey')
         assert not self.user.send.called       
 
+    def test_user_lengths_capped(self):
+        self.server.msg_received(self.user, 'user {} 0 * :{}'.format(
+            'a' * 100, 'b' * 100))
+        assert self.user.username == 'a' * self.server.config.userlen
+        assert self.user.realname == 'b' * self.server.config.realnamelen
+
     def test_user_noargs_before_registration(self):
         self.server.msg_received(self.user, 'user')
         self.user.send.assert_called_with(':{} {} * USER :Not enough '
@@ -345,7 +734,7 @@ class TestServer:
 
         calls = [call(':shira JOIN &chan'),
                  call(':{} {} shira @ &chan '
-                      ':shira'.format(self.server.host, RPL_NAMREPLY)),
+                      ':@shira'.format(self.server.host, RPL_NAMREPLY)),
                  call(':{} {} shira &chan :End of NAMES '
                       'list'.format(self.server.host, RPL_ENDOFNAMES))]
         
@@ -378,6 +767,8 @@ class TestServer:
         names = users.keys()
         names.append('shira')
         names.sort()
+        # the first user to join the channel is its operator
+        names[0] = '@' + names[0]
         calls = [call(':shira JOIN &chan'),
                  call(':{} {} shira @ &chan :{} {} '
                       '{}'.format(self.server.host, RPL_NAMREPLY,
@@ -427,7 +818,55 @@ class TestServer:
         self.user.send.reset_mock()
 
         self.server.msg_received(self.user, 'part &chan')
-        assert '&chan' in self.server.channels
+        assert '&chan' not in self.server.channels
+
+    def test_part_last_clears_modes(self):
+        self.register_user(self.user, 'shira')
+        self.server.msg_received(self.user, 'join &chan')
+        self.server.msg_received(self.user, 'mode &chan +ik key')
+        self.server.msg_received(self.user, 'privmsg &chan :hi')
+        self.server.msg_received(self.user, 'part &chan')
+        assert self.server.history.bytes == 0
+
+        other = FakeUser()
+        self.register_user(other, 'santa')
+        self.server.msg_received(other, 'join &chan')
+        assert other.channels[0].mode_string() == '+nt'
+        assert len(self.server.history.get(other.channels[0])) == 0
+
+    def test_join_churn(self):
+        self.register_user(self.user, 'shira')
+        for i in range(50):
+            self.server.msg_received(self.user, 'join &chan{}'.format(i))
+            self.server.msg_received(self.user, 'part &chan{}'.format(i))
+        assert not self.server.channels
+        assert self.server.channel_count == 0
+
+    def test_failed_join_creates_no_channel(self):
+        self.server.config = self.server.config._replace(max_channels=0)
+        self.register_user(self.user, 'shira')
+        self.server.msg_received(self.user, 'join &chan')
+        assert not self.server.channels
+
+    def test_channel_names_fold_case(self):
+        users = self.setup_channel('&Chan[x]', 1)
+        self.register_user(self.user, 'shira')
+        self.server.msg_received(self.user, 'join &CHAN{x}')
+        chan = self.server.channels['&chan[x]']
+        assert chan.has_user(self.user)
+        users['foo0'].send.assert_called_with(':shira JOIN &Chan[x]')
+        assert len(self.server.channels) == 1
+
+        users['foo0'].send.reset_mock()
+        self.server.msg_received(self.user, 'privmsg &chan{X} :hi')
+        users['foo0'].send.assert_called_with(':shira PRIVMSG &Chan[x] :hi')
+        self.server.msg_received(users['foo0'], 'mode &CHAN[X] +o shira')
+        assert self.user in chan.ops
+        self.server.msg_received(self.user, 'kick &chan[x] foo0')
+        assert not chan.has_user(users['foo0'])
+
+        self.server.msg_received(self.user, 'part &chan{x}')
+        assert '&Chan[x]' not in self.server.channels
 
     def test_part_noargs(self):
         self.register_user(self.user, 'shira')
@@ -472,8 +911,9 @@ class TestServer:
             assert u.send.call_count == 1
 
     def test_join_0(self):
-        self.setup_channel('&chan1', 2)
-        self.setup_channel('&chan2', 2)
+        users = self.setup_channel('&chan1', 2)
+        for u in users.values():
+            self.server.msg_received(u, 'join &chan2')
         self.register_user(self.user, 'shira')
         self.server.msg_received(self.user, 'join &chan1')
         self.server.msg_received(self.user, 'join &chan2')
@@ -550,6 +990,877 @@ class TestServer:
 
         assert not self.user.send.called
  
+    # Notice command
+
+    def test_notice_to_channel(self):
+        users = self.setup_channel('&chan', 2)
+        users['foo0'].send.reset_mock()
+        self.server.msg_received(users['foo0'], 'notice &chan :hi')
+        users['foo1'].send.assert_called_with(':foo0 NOTICE &chan :hi')
+        assert not users['foo0'].send.called
+
+    def test_notice_no_errors(self):
+        self.register_user(self.user, 'shira')
+        self.user.send.reset_mock()
+        self.server.msg_received(self.user, 'notice santa :hi')
+        self.server.msg_received(self.user, 'notice santa')
+        self.server.msg_received(self.user, 'notice')
+        assert not self.user.send.called
+
+    def test_privmsg_tag_variants(self):
+        users = self.setup_channel('&chan', 4)
+        users['foo1'].caps = frozenset(['server-time'])
+        users['foo2'].caps = frozenset(['server-time', 'message-tags'])
+        users['foo3'].caps = frozenset(['server-time'])
+        self.clock.advance(1.5)
+
+        self.server.msg_received(users['foo0'], 'privmsg &chan :hi')
+        users['foo1'].send.assert_called_with(
+            '@time=1970-01-01T00:00:01.500Z :foo0 PRIVMSG &chan :hi')
+        users['foo2'].send.assert_called_with(
+            '@time=1970-01-01T00:00:01.500Z;msgid=1 :foo0 PRIVMSG &chan :hi')
+        # users with the same capabilities are sent the same string
+        assert (users['foo1'].send.call_args[0][0] is
+                users['foo3'].send.call_args[0][0])
+
+    def test_echo_message(self):
+        users = self.setup_channel('&chan', 2)
+        users['foo0'].caps = frozenset(['echo-message'])
+        users['foo0'].send.reset_mock()
+
+        self.server.msg_received(users['foo0'], 'privmsg &chan :hi')
+        users['foo0'].send.assert_called_with(':foo0 PRIVMSG &chan :hi')
+
+        self.server.msg_received(users['foo0'], 'privmsg foo1 :hi')
+        users['foo0'].send.assert_called_with(':foo0 PRIVMSG foo1 :hi')
+        users['foo1'].send.assert_called_with(':foo0 PRIVMSG foo1 :hi')
+
+    # Chathistory command
+
+    def setup_history(self, n):
+        users = self.setup_channel('&chan', 2)
+        for i in range(n):
+            self.clock.advance(1)
+            self.server.msg_received(users['foo0'],
+                                     'privmsg &chan :msg{}'.format(i))
+        users['foo1'].send.reset_mock()
+        return users
+
+    def sent_lines(self, user):
+        return [c[0][0] for c in user.send.call_args_list]
+
+    def test_chathistory_latest(self):
+        users = self.setup_history(5)
+        self.server.msg_received(users['foo1'], 'chathistory latest &chan * 2')
+        assert self.sent_lines(users['foo1']) == [
+            ':foo0 PRIVMSG &chan :msg3', ':foo0 PRIVMSG &chan :msg4']
+
+    def test_chathistory_before(self):
+        users = self.setup_history(5)
+        self.server.msg_received(users['foo1'],
+                                 'chathistory before &chan msgid=3 5')
+        assert self.sent_lines(users['foo1']) == [
+            ':foo0 PRIVMSG &chan :msg0', ':foo0 PRIVMSG &chan :msg1']
+
+    def test_chathistory_after_timestamp(self):
+        users = self.setup_history(5)
+        self.server.msg_received(users['foo1'], 'chathistory after &chan '
+                                 'timestamp=1970-01-01T00:00:03.000Z 1')
+        assert self.sent_lines(users['foo1']) == [
+            ':foo0 PRIVMSG &chan :msg3']
+
+    def test_chathistory_after_own_time(self):
+        # the stored time is the millisecond one that was sent
+        users = self.setup_channel('&chan', 2)
+        for i in range(2):
+            self.clock.advance(1.0004)
+            self.server.msg_received(users['foo0'],
+                                     'privmsg &chan :msg{}'.format(i))
+        users['foo1'].send.reset_mock()
+        self.server.msg_received(users['foo1'], 'chathistory after &chan '
+                                 'timestamp=1970-01-01T00:00:01.000Z 10')
+        assert self.sent_lines(users['foo1']) == [
+            ':foo0 PRIVMSG &chan :msg1']
+
+    def test_chathistory_between(self):
+        users = self.setup_history(5)
+        self.server.msg_received(users['foo1'], 'chathistory between &chan '
+                                 'msgid=1 msgid=5 10')
+        assert self.sent_lines(users['foo1']) == [
+            ':foo0 PRIVMSG &chan :msg1', ':foo0 PRIVMSG &chan :msg2',
+            ':foo0 PRIVMSG &chan :msg3']
+
+    def test_chathistory_limit_capped(self):
+        self.server.config = self.server.config._replace(history_limit=1)
+        users = self.setup_history(5)
+        self.server.msg_received(users['foo1'],
+                                 'chathistory latest &chan * 10')
+        assert self.sent_lines(users['foo1']) == [
+            ':foo0 PRIVMSG &chan :msg4']
+
+    def test_chathistory_batch(self):
+        users = self.setup_history(2)
+        users['foo1'].caps = frozenset(['batch', 'server-time'])
+        self.server.msg_received(users['foo1'], 'chathistory latest &chan * 2')
+        assert self.sent_lines(users['foo1']) == [
+            ':{} BATCH +1 chathistory &chan'.format(self.server.host),
+            '@batch=1;time=1970-01-01T00:00:01.000Z :foo0 PRIVMSG &chan :msg0',
+            '@batch=1;time=1970-01-01T00:00:02.000Z :foo0 PRIVMSG &chan :msg1',
+            ':{} BATCH -1'.format(self.server.host)]
+
+    def test_chathistory_not_member(self):
+        self.setup_history(1)
+        self.register_user(self.user, 'shira')
+        self.user.send.reset_mock()
+
+        self.server.msg_received(self.user, 'chathistory latest &chan * 10')
+        self.user.send.assert_called_with(':{} FAIL CHATHISTORY '
+            'INVALID_TARGET LATEST &chan :Messages could not be '
+            'retrieved'.format(self.server.host))
+
+    def test_chathistory_invalid(self):
+        users = self.setup_history(1)
+        self.server.msg_received(users['foo1'],
+                                 'chathistory before &chan * 10')
+        users['foo1'].send.assert_called_with(':{} FAIL CHATHISTORY '
+            'INVALID_PARAMS BEFORE :Invalid '
+            'parameters'.format(self.server.host))
+        self.server.msg_received(users['foo1'],
+                                 'chathistory between &chan msgid=1 10')
+        users['foo1'].send.assert_called_with(':{} FAIL CHATHISTORY '
+            'INVALID_PARAMS BETWEEN :Invalid '
+            'parameters'.format(self.server.host))
+
+    # Mode command
+
+    def test_mode_query(self):
+        self.register_user(self.user, 'shira')
+        self.server.msg_received(self.user, 'join &chan')
+        self.user.send.reset_mock()
+
+        self.server.msg_received(self.user, 'mode &chan')
+        self.user.send.assert_called_with(':{} {} shira &chan '
+            '+nt'.format(self.server.host, RPL_CHANNELMODEIS))
+
+    def test_mode_set_flags(self):
+        users = self.setup_channel('&chan', 2)
+        self.server.msg_received(users['foo0'], 'mode &chan +im-t')
+
+        chan = self.server.channels['&chan']
+        assert chan.modes == set('imn')
+        for user in users.values():
+            user.send.assert_called_with(':foo0 MODE &chan +im-t')
+
+    def test_mode_key_and_limit(self):
+        users = self.setup_channel('&chan', 1)
+        self.server.msg_received(users['foo0'], 'mode &chan +kl secret 5')
+
+        chan = self.server.channels['&chan']
+        assert chan.key == 'secret'
+        assert chan.limit == 5
+        users['foo0'].send.assert_called_with(':foo0 MODE &chan +kl '
+                                              'secret 5')
+
+    def test_mode_not_op(self):
+        users = self.setup_channel('&chan', 2)
+        self.server.msg_received(users['foo1'], 'mode &chan +m')
+
+        assert not 'm' in self.server.channels['&chan'].modes
+        users['foo1'].send.assert_called_with(':{} {} foo1 &chan :You\'re '
+            'not channel operator'.format(self.server.host,
+                                         ERR_CHANOPRIVSNEEDED))
+
+    def test_mode_unknown(self):
+        users = self.setup_channel('&chan', 1)
+        self.server.msg_received(users['foo0'], 'mode &chan +Z')
+        users['foo0'].send.assert_called_with(':{} {} foo0 Z :is unknown '
+            'mode char to me for &chan'.format(self.server.host,
+                                              ERR_UNKNOWNMODE))
+
+    def test_mode_op(self):
+        users = self.setup_channel('&chan', 2)
+        self.server.msg_received(users['foo0'], 'mode &chan +o foo1')
+
+        assert users['foo1'] in self.server.channels['&chan'].ops
+        users['foo1'].send.assert_called_with(':foo0 MODE &chan +o foo1')
+
+    def test_mode_ban_list(self):
+        users = self.setup_channel('&chan', 1)
+        self.server.msg_received(users['foo0'], 'mode &chan +b shira')
+        users['foo0'].send.reset_mock()
+
+        self.server.msg_received(users['foo0'], 'mode &chan +b')
+        calls = [call(':{} {} foo0 &chan shira!*@*'.format(self.server.host,
+                                                           RPL_BANLIST)),
+                 call(':{} {} foo0 &chan :End of channel ban '
+                      'list'.format(self.server.host, RPL_ENDOFBANLIST))]
+        users['foo0'].send.assert_has_calls(calls)
+
+    def test_join_banned(self):
+        users = self.setup_channel('&chan', 1)
+        self.server.msg_received(users['foo0'], 'mode &chan +b shira!*@*')
+        self.register_user(self.user, 'shira')
+        self.user.send.reset_mock()
+
+        self.server.msg_received(self.user, 'join &chan')
+        assert not self.user in self.server.channels['&chan'].users
+        self.user.send.assert_called_with(':{} {} shira &chan :Cannot join '
+            'channel (+b)'.format(self.server.host, ERR_BANNEDFROMCHAN))
+
+    def test_join_crafted_ban(self):
+        users = self.setup_channel('&chan', 1)
+        self.server.msg_received(users['foo0'],
+                                 'mode &chan +b {}'.format('*a' * 8 + '*b'))
+        self.server.msg_received(self.user, 'pass password')
+        self.server.msg_received(self.user, 'nick shira')
+        self.server.msg_received(self.user, 'user {} 0 * :{}'.format(
+            'a' * 100, 'a' * 100))
+
+        start = time.time()
+        self.server.msg_received(self.user, 'join &chan')
+        assert time.time() - start < 1
+        assert self.user in self.server.channels['&chan'].users
+
+    def test_join_banned_with_exception(self):
+        users = self.setup_channel('&chan', 1)
+        self.server.msg_received(users['foo0'], 'mode &chan +be s* shira')
+        self.register_user(self.user, 'shira')
+
+        self.server.msg_received(self.user, 'join &chan')
+        assert self.user in self.server.channels['&chan'].users
+
+    def test_join_invite_only(self):
+        users = self.setup_channel('&chan', 1)
+        self.server.msg_received(users['foo0'], 'mode &chan +i')
+        self.register_user(self.user, 'shira')
+        self.user.send.reset_mock()
+
+        self.server.msg_received(self.user, 'join &chan')
+        self.user.send.assert_called_with(':{} {} shira &chan :Cannot join '
+            'channel (+i)'.format(self.server.host, ERR_INVITEONLYCHAN))
+
+        self.server.msg_received(users['foo0'], 'mode &chan +I *!shira@*')
+        self.server.msg_received(self.user, 'join &chan')
+        assert self.user in self.server.channels['&chan'].users
+
+    def test_join_key(self):
+        users = self.setup_channel('&chan', 1)
+        self.server.msg_received(users['foo0'], 'mode &chan +k secret')
+        self.register_user(self.user, 'shira')
+        self.user.send.reset_mock()
+
+        self.server.msg_received(self.user, 'join &chan')
+        self.user.send.assert_called_with(':{} {} shira &chan :Cannot join '
+            'channel (+k)'.format(self.server.host, ERR_BADCHANNELKEY))
+
+        self.server.msg_received(self.user, 'join &chan secret')
+        assert self.user in self.server.channels['&chan'].users
+
+    def test_join_limit(self):
+        users = self.setup_channel('&chan', 1)
+        self.server.msg_received(users['foo0'], 'mode &chan +l 1')
+        self.register_user(self.user, 'shira')
+        self.user.send.reset_mock()
+
+        self.server.msg_received(self.user, 'join &chan')
+        self.user.send.assert_called_with(':{} {} shira &chan :Cannot join '
+            'channel (+l)'.format(self.server.host, ERR_CHANNELISFULL))
+
+    def test_privmsg_banned_member(self):
+        users = self.setup_channel('&chan', 2)
+        self.server.msg_received(users['foo0'], 'mode &chan +b foo1')
+        users['foo0'].send.reset_mock()
+
+        self.server.msg_received(users['foo1'], 'privmsg &chan :hi')
+        assert not users['foo0'].send.called
+        users['foo1'].send.assert_called_with(':{} {} foo1 &chan :Cannot '
+            'send to channel'.format(self.server.host, ERR_CANNOTSENDTOCHAN))
+
+        self.server.msg_received(users['foo0'], 'mode &chan -b foo1')
+        self.server.msg_received(users['foo1'], 'privmsg &chan :hi')
+        users['foo0'].send.assert_called_with(':foo1 PRIVMSG &chan :hi')
+
+    def test_privmsg_ban_after_nick_change(self):
+        users = self.setup_channel('&chan', 2)
+        self.server.msg_received(users['foo0'], 'mode &chan +b shira')
+        self.server.msg_received(users['foo1'], 'privmsg &chan :hi')
+        self.server.msg_received(users['foo1'], 'nick shira')
+        users['foo0'].send.reset_mock()
+
+        self.server.msg_received(users['foo1'], 'privmsg &chan :hi')
+        assert not users['foo0'].send.called
+
+    def test_privmsg_moderated(self):
+        users = self.setup_channel('&chan', 2)
+        self.server.msg_received(users['foo0'], 'mode &chan +m')
+        users['foo0'].send.reset_mock()
+
+        self.server.msg_received(users['foo1'], 'privmsg &chan :hi')
+        assert not users['foo0'].send.called
+
+        self.server.msg_received(users['foo0'], 'mode &chan +v foo1')
+        self.server.msg_received(users['foo1'], 'privmsg &chan :hi')
+        users['foo0'].send.assert_called_with(':foo1 PRIVMSG &chan :hi')
+
+    def test_privmsg_no_external(self):
+        users = self.setup_channel('&chan', 1)
+        self.register_user(self.user, 'shira')
+        self.user.send.reset_mock()
+
+        self.server.msg_received(self.user, 'privmsg &chan :hi')
+        assert not users['foo0'].send.called
+        self.user.send.assert_called_with(':{} {} shira &chan :Cannot '
+            'send to channel'.format(self.server.host, ERR_CANNOTSENDTOCHAN))
+
+    # Kick command
+
+    def test_kick(self):
+        users = self.setup_channel('&chan', 3)
+        self.server.msg_received(users['foo0'], 'kick &chan foo1 :bye')
+        for u in users.values():
+            u.send.assert_called_with(':foo0 KICK &chan foo1 :bye')
+        chan = self.server.channels['&chan']
+        assert not users['foo1'] in chan.users
+        assert not chan in users['foo1'].channels
+
+        users['foo2'].send.reset_mock()
+        self.server.msg_received(users['foo1'], 'privmsg &chan :hi')
+        assert not users['foo2'].send.called
+
+    def test_kick_default_reason(self):
+        users = self.setup_channel('&chan', 2)
+        self.server.msg_received(users['foo0'], 'kick &chan foo1')
+        users['foo1'].send.assert_called_with(':foo0 KICK &chan foo1 :foo0')
+
+    def test_kick_not_op(self):
+        users = self.setup_channel('&chan', 2)
+        self.server.msg_received(users['foo1'], 'kick &chan foo0')
+        users['foo1'].send.assert_called_with(':{} {} foo1 &chan :You\'re '
+            'not channel operator'.format(self.server.host,
+                                          ERR_CHANOPRIVSNEEDED))
+        assert users['foo0'] in self.server.channels['&chan'].users
+
+    def test_kick_errors(self):
+        users = self.setup_channel('&chan', 1)
+        self.register_user(self.user, 'shira')
+        self.user.send.reset_mock()
+
+        self.server.msg_received(self.user, 'kick &chan')
+        self.user.send.assert_called_with(':{} {} shira KICK :Not enough '
+            'parameters'.format(self.server.host, ERR_NEEDMOREPARAMS))
+        self.server.msg_received(self.user, 'kick &nochan foo0')
+        self.user.send.assert_called_with(':{} {} shira &nochan :No such '
+            'channel'.format(self.server.host, ERR_NOSUCHCHANNEL))
+        self.server.msg_received(self.user, 'kick &chan foo0')
+        self.user.send.assert_called_with(':{} {} shira &chan :You\'re not '
+            'on that channel'.format(self.server.host, ERR_NOTONCHANNEL))
+
+        self.server.msg_received(users['foo0'], 'kick &chan shira')
+        users['foo0'].send.assert_called_with(':{} {} foo0 shira &chan '
+            ':They aren\'t on that channel'.format(self.server.host,
+                                                   ERR_USERNOTINCHANNEL))
+
+    # Invite command
+
+    def setup_invite_only(self):
+        users = self.setup_channel('&chan', 1)
+        self.server.msg_received(users['foo0'], 'mode &chan +i')
+        self.register_user(self.user, 'shira')
+        users['foo0'].send.reset_mock()
+        self.user.send.reset_mock()
+        return users
+
+    def test_invite(self):
+        users = self.setup_invite_only()
+        self.server.msg_received(users['foo0'], 'invite shira &chan')
+        users['foo0'].send.assert_called_with(':{} {} foo0 shira '
+            '&chan'.format(self.server.host, RPL_INVITING))
+        self.user.send.assert_called_with(':foo0 INVITE shira &chan')
+
+        self.server.msg_received(self.user, 'join &chan')
+        assert self.user in self.server.channels['&chan'].users
+
+    def test_invite_used_once(self):
+        users = self.setup_invite_only()
+        self.server.msg_received(users['foo0'], 'invite shira &chan')
+        self.server.msg_received(self.user, 'join &chan')
+        self.server.msg_received(self.user, 'part &chan')
+        self.server.msg_received(self.user, 'join &chan')
+        self.user.send.assert_called_with(':{} {} shira &chan :Cannot join '
+            'channel (+i)'.format(self.server.host, ERR_INVITEONLYCHAN))
+
+    def test_invite_expires(self):
+        users = self.setup_invite_only()
+        self.server.msg_received(users['foo0'], 'invite shira &chan')
+        self.clock.advance(self.server.config.invite_expiry)
+        self.server.msg_received(self.user, 'join &chan')
+        self.user.send.assert_called_with(':{} {} shira &chan :Cannot join '
+            'channel (+i)'.format(self.server.host, ERR_INVITEONLYCHAN))
+
+    def test_invite_dropped_on_quit(self):
+        users = self.setup_invite_only()
+        self.server.msg_received(users['foo0'], 'invite shira &chan')
+        self.server.msg_received(self.user, 'quit')
+        assert not self.server.channels['&chan'].invites
+        assert not self.server.invited
+
+    def test_invite_not_op(self):
+        users = self.setup_invite_only()
+        other = FakeUser()
+        self.register_user(other, 'santa')
+        self.server.msg_received(self.user, 'invite santa &chan')
+        self.user.send.assert_called_with(':{} {} shira &chan :You\'re not '
+            'on that channel'.format(self.server.host, ERR_NOTONCHANNEL))
+
+        self.server.msg_received(users['foo0'], 'mode &chan +v santa')
+        self.server.msg_received(users['foo0'], 'invite santa &chan')
+        self.server.msg_received(other, 'join &chan')
+        self.server.msg_received(other, 'invite shira &chan')
+        other.send.assert_called_with(':{} {} santa &chan :You\'re not '
+            'channel operator'.format(self.server.host, ERR_CHANOPRIVSNEEDED))
+
+    def test_invite_errors(self):
+        users = self.setup_channel('&chan', 2)
+        self.server.msg_received(users['foo0'], 'invite foo1 &chan')
+        users['foo0'].send.assert_called_with(':{} {} foo0 foo1 &chan :is '
+            'already on channel'.format(self.server.host, ERR_USERONCHANNEL))
+        self.server.msg_received(users['foo0'], 'invite nobody &chan')
+        users['foo0'].send.assert_called_with(':{} {} foo0 nobody :No such '
+            'nick/channel'.format(self.server.host, ERR_NOSUCHNICK))
+        self.server.msg_received(users['foo0'], 'invite foo1')
+        users['foo0'].send.assert_called_with(':{} {} foo0 INVITE :Not '
+            'enough parameters'.format(self.server.host, ERR_NEEDMOREPARAMS))
+
+    # Away command
+
+    def test_away(self):
+        self.register_user(self.user, 'shira')
+        self.server.msg_received(self.user, 'away :gone fishing')
+        self.user.send.assert_called_with(':{} {} shira :You have been '
+            'marked as being away'.format(self.server.host, RPL_NOWAWAY))
+        assert self.user.away == 'gone fishing'
+
+        self.server.msg_received(self.user, 'away')
+        self.user.send.assert_called_with(':{} {} shira :You are no longer '
+            'marked as being away'.format(self.server.host, RPL_UNAWAY))
+        assert self.user.away is None
+
+    def test_away_privmsg(self):
+        other = FakeUser()
+        self.register_user(other, 'santa')
+        self.register_user(self.user, 'shira')
+        self.server.msg_received(other, 'away :gone fishing')
+        self.user.send.reset_mock()
+
+        self.server.msg_received(self.user, 'privmsg santa :hi')
+        self.user.send.assert_called_with(':{} {} shira santa :gone '
+            'fishing'.format(self.server.host, RPL_AWAY))
+        other.send.assert_called_with(':shira PRIVMSG santa :hi')
+
+        self.user.send.reset_mock()
+        self.server.msg_received(self.user, 'notice santa :hi')
+        assert not self.user.send.called
+
+    def test_away_who(self):
+        users = self.setup_channel('&chan', 1)
+        self.server.msg_received(users['foo0'], 'away :brb')
+        self.register_user(self.user, 'shira')
+        self.user.send.reset_mock()
+
+        self.server.msg_received(self.user, 'who &chan')
+        self.user.send.assert_any_call(':{0} {1} shira &chan foo0 localhost '
+            '{0} foo0 G@ :0 foo0'.format(self.server.host, RPL_WHOREPLY))
+
+    # Quit command
+
+    def test_quit(self):
+        users = self.setup_channel('&chan', 2)
+        self.register_user(self.user, 'shira')
+        self.server.msg_received(self.user, 'join &chan')
+
+        self.server.msg_received(self.user, 'quit :bye')
+        assert not 'shira' in self.server.users
+        assert not self.user in self.server.channels['&chan'].users
+        assert self.user.close.called
+        for user in users.values():
+            user.send.assert_called_with(':shira QUIT :bye')
+
+    def test_quit_frees_nick(self):
+        self.register_user(self.user, 'shira')
+        self.server.connection_lost(self.user)
+
+        other = FakeUser()
+        self.register_user(other, 'shira')
+        assert self.server.users.get('shira') is other
+
+    def test_nick_case_insensitive(self):
+        other = FakeUser()
+        self.register_user(other, 'shira')
+
+        self.server.msg_received(self.user, 'nick SHIRA')
+        assert self.user.nick == '*'
+
+    def test_change_nick_case(self):
+        self.register_user(self.user, 'shira')
+        self.server.msg_received(self.user, 'nick Shira')
+        assert self.user.nick == 'Shira'
+        assert self.server.users.get('shira') is self.user
+
+    # Who command
+
+    def test_who_channel(self):
+        self.setup_channel('&chan', 2)
+        self.register_user(self.user, 'shira')
+        self.user.send.reset_mock()
+
+        self.server.msg_received(self.user, 'who &chan')
+        calls = [call(':{0} {1} shira &chan foo0 localhost {0} foo0 H@ '
+                      ':0 foo0'.format(self.server.host, RPL_WHOREPLY)),
+                 call(':{0} {1} shira &chan foo1 localhost {0} foo1 H '
+                      ':0 foo1'.format(self.server.host, RPL_WHOREPLY)),
+                 call(':{} {} shira &chan :End of WHO '
+                      'list'.format(self.server.host, RPL_ENDOFWHO))]
+        self.user.send.assert_has_calls(calls)
+
+    def test_who_nick(self):
+        self.setup_channel('&chan', 2)
+        self.register_user(self.user, 'shira')
+        self.user.send.reset_mock()
+
+        self.server.msg_received(self.user, 'who FOO1')
+        assert self.user.send.call_count == 2
+        self.user.send.assert_any_call(':{0} {1} shira &chan foo1 localhost '
+            '{0} foo1 H :0 foo1'.format(self.server.host, RPL_WHOREPLY))
+
+    def test_who_mask(self):
+        self.setup_channel('&chan', 3)
+        self.register_user(self.user, 'shira')
+        self.user.send.reset_mock()
+
+        self.server.msg_received(self.user, 'who foo*')
+        assert self.user.send.call_count == 4
+
+    def test_who_crafted_mask(self):
+        for nick in ['foo', 'bar']:
+            u = FakeUser()
+            self.server.msg_received(u, 'pass password')
+            self.server.msg_received(u, 'nick ' + nick)
+            self.server.msg_received(u, 'user x 0 * :' + 'a' * 80)
+        self.register_user(self.user, 'shira')
+        self.user.send.reset_mock()
+
+        start = time.time()
+        self.server.msg_received(self.user, 'who ' + '*a' * 10 + '*b')
+        assert time.time() - start < 1
+        assert self.user.send.call_count == 1
+
+    def test_who_limit(self):
+        self.server.config = self.server.config._replace(who_replies=2)
+        self.setup_channel('&chan', 3)
+        self.register_user(self.user, 'shira')
+        self.user.send.reset_mock()
+
+        self.server.msg_received(self.user, 'who *')
+        assert self.user.send.call_count == 3
+
+    # Whois command
+
+    def test_whois(self):
+        self.setup_channel('&chan', 1)
+        self.register_user(self.user, 'shira')
+        self.user.send.reset_mock()
+
+        self.server.msg_received(self.user, 'whois foo0')
+        calls = [call(':{} {} shira foo0 foo0 localhost * '
+                      ':foo0'.format(self.server.host, RPL_WHOISUSER)),
+                 call(':{} {} shira foo0 :@&chan'.format(self.server.host,
+                                                        RPL_WHOISCHANNELS)),
+                 call(':{0} {1} shira foo0 {0} '
+                      ':{2}'.format(self.server.host, RPL_WHOISSERVER,
+                                    self.server.name)),
+                 call(':{} {} shira foo0 :End of WHOIS '
+                      'list'.format(self.server.host, RPL_ENDOFWHOIS))]
+        self.user.send.assert_has_calls(calls)
+
+    def test_whois_non_existent(self):
+        self.register_user(self.user, 'shira')
+        self.user.send.reset_mock()
+
+        self.server.msg_received(self.user, 'whois santa')
+        self.user.send.assert_called_with(':{} {} shira santa :No such '
+            'nick/channel'.format(self.server.host, ERR_NOSUCHNICK))
+
+    # Whowas command
+
+    def test_whowas_after_nick_change(self):
+        self.register_user(self.user, 'santa')
+        self.server.msg_received(self.user, 'nick shira')
+        self.user.send.reset_mock()
+
+        self.server.msg_received(self.user, 'whowas santa')
+        calls = [call(':{} {} shira santa santa localhost * '
+                      ':santa'.format(self.server.host, RPL_WHOWASUSER)),
+                 call(':{0} {1} shira santa {0} '
+                      ':{2}'.format(self.server.host, RPL_WHOISSERVER,
+                                    self.server.name)),
+                 call(':{} {} shira santa :End of '
+                      'WHOWAS'.format(self.server.host, RPL_ENDOFWHOWAS))]
+        self.user.send.assert_has_calls(calls)
+
+    def test_whowas_after_quit(self):
+        other = FakeUser()
+        self.register_user(other, 'santa')
+        self.server.msg_received(other, 'quit')
+        self.register_user(self.user, 'shira')
+        self.user.send.reset_mock()
+
+        self.server.msg_received(self.user, 'whowas santa')
+        self.user.send.assert_any_call(':{} {} shira santa santa localhost * '
+            ':santa'.format(self.server.host, RPL_WHOWASUSER))
+
+    def test_whowas_no_such_nick(self):
+        self.register_user(self.user, 'shira')
+        self.user.send.reset_mock()
+
+        self.server.msg_received(self.user, 'whowas santa')
+        calls = [call(':{} {} shira santa :There was no such '
+                      'nickname'.format(self.server.host, ERR_WASNOSUCHNICK)),
+                 call(':{} {} shira santa :End of '
+                      'WHOWAS'.format(self.server.host, RPL_ENDOFWHOWAS))]
+        self.user.send.assert_has_calls(calls)
+
+    # Ison and userhost commands
+
+    def test_ison(self):
+        self.setup_channel('&chan', 2)
+        self.register_user(self.user, 'shira')
+        self.user.send.reset_mock()
+
+        self.server.msg_received(self.user, 'ison FOO0 santa foo1')
+        self.user.send.assert_called_with(':{} {} shira :foo0 '
+            'foo1'.format(self.server.host, RPL_ISON))
+
+    def test_ison_trailing(self):
+        self.setup_channel('&chan', 1)
+        self.register_user(self.user, 'shira')
+        self.user.send.reset_mock()
+
+        self.server.msg_received(self.user, 'ison :foo0 santa')
+        self.user.send.assert_called_with(':{} {} shira '
+            ':foo0'.format(self.server.host, RPL_ISON))
+
+    def test_userhost(self):
+        self.setup_channel('&chan', 1)
+        self.register_user(self.user, 'shira')
+        self.user.send.reset_mock()
+
+        self.server.msg_received(self.user, 'userhost foo0 santa')
+        self.user.send.assert_called_with(':{} {} shira '
+            ':foo0=+foo0@localhost'.format(self.server.host, RPL_USERHOST))
+
+    def test_userhost_oper_away(self):
+        users = self.setup_channel('&chan', 2)
+        users['foo0'].oper = True
+        self.server.msg_received(users['foo1'], 'away :lunch')
+        self.register_user(self.user, 'shira')
+        self.user.send.reset_mock()
+
+        self.server.msg_received(self.user, 'userhost foo0 foo1')
+        self.user.send.assert_called_with(':{} {} shira '
+            ':foo0*=+foo0@localhost foo1=-foo1@localhost'.format(
+                self.server.host, RPL_USERHOST))
+
+    # Configured limits
+
+    def test_max_channels(self):
+        self.server.config = self.server.config._replace(max_channels=1)
+        self.register_user(self.user, 'shira')
+        self.server.msg_received(self.user, 'join &chan1')
+        self.user.send.reset_mock()
+
+        self.server.msg_received(self.user, 'join &chan2')
+        assert len(self.user.channels) == 1
+        self.user.send.assert_called_with(':{} {} shira &chan2 :You have '
+            'joined too many channels'.format(self.server.host,
+                                              ERR_TOOMANYCHANNELS))
+
+    def test_privmsg_multiple_targets(self):
+        users = self.setup_channel('&chan', 2)
+        self.register_user(self.user, 'shira')
+
+        self.server.msg_received(self.user, 'privmsg foo0,foo1 :hi')
+        users['foo0'].send.assert_called_with(':shira PRIVMSG foo0 :hi')
+        users['foo1'].send.assert_called_with(':shira PRIVMSG foo1 :hi')
+
+    def test_privmsg_too_many_targets(self):
+        self.server.config = self.server.config._replace(targmax=1)
+        users = self.setup_channel('&chan', 2)
+        self.register_user(self.user, 'shira')
+        self.user.send.reset_mock()
+        users['foo0'].send.reset_mock()
+
+        self.server.msg_received(self.user, 'privmsg foo0,foo1 :hi')
+        assert not users['foo0'].send.called
+        self.user.send.assert_called_with(':{} {} shira foo0,foo1 :Too many '
+            'recipients'.format(self.server.host, ERR_TOOMANYTARGETS))
+
+    def test_long_nick_configured(self):
+        self.server.config = self.server.config._replace(nicklen=12)
+        self.server.msg_received(self.user, 'nick shira6789012345')
+        assert self.user.nick == 'shira6789012'
+
+    # Motd and rehash commands
+
+    def test_motd(self):
+        self.server.config = self.server.config._replace(motd=('hello',))
+        self.register_user(self.user, 'shira')
+        self.user.send.reset_mock()
+
+        self.server.msg_received(self.user, 'motd')
+        calls = [call(':{0} {1} shira :- {0} Message of the day - '.format(
+                     self.server.host, RPL_MOTDSTART)),
+                 call(':{} {} shira :- hello'.format(self.server.host,
+                                                    RPL_MOTD)),
+                 call(':{} {} shira :End of MOTD '
+                      'command'.format(self.server.host, RPL_ENDOFMOTD))]
+        self.user.send.assert_has_calls(calls)
+
+    def test_no_motd(self):
+        self.register_user(self.user, 'shira')
+        self.user.send.reset_mock()
+
+        self.server.msg_received(self.user, 'motd')
+        self.user.send.assert_called_with(':{} {} shira :MOTD File is '
+            'missing'.format(self.server.host, ERR_NOMOTD))
+
+    def test_rehash_not_oper(self):
+        self.register_user(self.user, 'shira')
+        self.user.send.reset_mock()
+
+        self.server.msg_received(self.user, 'rehash')
+        self.user.send.assert_called_with(':{} {} shira :Permission Denied- '
+            'You\'re not an IRC operator'.format(self.server.host,
+                                                 ERR_NOPRIVILEGES))
+
+    def test_rehash(self, tmpdir):
+        path = tmpdir.join('ircd.conf')
+        path.write('[limits]\nnicklen = 5\n')
+        self.server.config = load_config(str(path))
+        self.register_user(self.user, 'shira')
+        self.user.oper = True
+        self.user.send.reset_mock()
+
+        path.write('[limits]\nnicklen = 12\n')
+        self.server.msg_received(self.user, 'rehash')
+        self.user.send.assert_called_with(':{} {} shira {} '
+            ':Rehashing'.format(self.server.host, RPL_REHASHING, str(path)))
+        assert self.server.config.nicklen == 12
+
+    def test_rehash_resizes_history(self, tmpdir):
+        path = tmpdir.join('ircd.conf')
+        path.write('[limits]\nhistory_size = 10\n')
+        self.server.config = load_config(str(path))
+        self.register_user(self.user, 'shira')
+        self.server.msg_received(self.user, 'join &chan')
+        for n in range(5):
+            self.server.msg_received(self.user, 'privmsg &chan :{}'.format(n))
+
+        path.write('[limits]\nhistory_size = 2\n')
+        assert self.server.rehash()
+        history = self.server.history.get(self.server.channels['&chan'])
+        assert [e.line for e in history.entries] == [
+            ':shira PRIVMSG &chan :3', ':shira PRIVMSG &chan :4']
+
+    def test_rehash_bad_config(self, tmpdir):
+        path = tmpdir.join('ircd.conf')
+        path.write('[limits]\nnicklen = 5\n')
+        self.server.config = load_config(str(path))
+
+        path.write('[limits]\nnicklen = five\n')
+        assert not self.server.rehash()
+        assert self.server.config.nicklen == 5
+
+        path.write('[connections]\nconnect_rate = 0\n')
+        assert not self.server.rehash()
+        assert self.server.config.connect_rate > 0
+        self.server.throttle.expire(self.clock.seconds())
+
+    # Lusers command
+
+    def lusers(self):
+        self.user.send.reset_mock()
+        self.server.msg_received(self.user, 'lusers')
+        return [c[0][0] for c in self.user.send.call_args_list]
+
+    def test_register_sends_lusers_and_motd(self):
+        self.server.config = self.server.config._replace(motd=('hello',))
+        self.register_user(self.user, 'shira')
+        self.user.send.assert_any_call(':{} {} shira :There are 1 users and '
+            '0 services on 1 servers'.format(self.server.host,
+                                             RPL_LUSERCLIENT))
+        self.user.send.assert_called_with(':{} {} shira :End of MOTD '
+            'command'.format(self.server.host, RPL_ENDOFMOTD))
+
+    def test_register_sends_isupport(self):
+        self.register_user(self.user, 'shira')
+        self.user.send.assert_any_call(':{} {} shira CASEMAPPING=rfc1459 '
+            'CHANLIMIT=#&+!:20 CHANMODES=beI,k,l,imnpst CHANNELLEN=50 '
+            'CHANTYPES=#&+! EXCEPTS INVEX MAXTARGETS=4 NICKLEN=9 '
+            'PREFIX=(ov)@+ USERLEN=10 :are supported by this '
+            'server'.format(self.server.host, RPL_ISUPPORT))
+
+    def test_lusers(self):
+        users = self.setup_channel('&chan', 2)
+        self.register_user(self.user, 'shira')
+        self.server.throttle.connected(FakeUser())
+        self.server.opers.add(users['foo0'])
+
+        assert self.lusers() == [
+            ':{} {} shira :There are 3 users and 0 services on 1 '
+            'servers'.format(self.server.host, RPL_LUSERCLIENT),
+            ':{} {} shira 1 :operator(s) online'.format(self.server.host,
+                                                       RPL_LUSEROP),
+            ':{} {} shira 1 :unknown connection(s)'.format(self.server.host,
+                                                          RPL_LUSERUNKNOWN),
+            ':{} {} shira 1 :channels formed'.format(self.server.host,
+                                                    RPL_LUSERCHANNELS),
+            ':{} {} shira :I have 3 clients and 0 servers'.format(
+                self.server.host, RPL_LUSERME)]
+
+    def test_lusers_channel_count(self):
+        users = self.setup_channel('&chan', 2)
+        self.register_user(self.user, 'shira')
+        self.server.msg_received(self.user, 'join &other')
+        assert self.server.channel_count == 2
+
+        self.server.msg_received(self.user, 'part &other')
+        assert self.server.channel_count == 1
+        self.server.msg_received(users['foo0'], 'part &chan')
+        assert self.server.channel_count == 1
+        self.server.connection_lost(users['foo1'])
+        assert self.server.channel_count == 0
+
+        self.server.msg_received(self.user, 'join &chan')
+        self.server.msg_received(self.user, 'join 0')
+        assert self.server.channel_count == 0
+
+    def test_lusers_opers(self):
+        self.server.config = self.server.config._replace(
+            opers={'admin': hash_password('operpass', 10)})
+        self.register_user(self.user, 'shira')
+        self.server.msg_received(self.user, 'oper admin operpass')
+        assert self.server.stats()['opers'] == 1
+
+        self.server.connection_lost(self.user)
+        assert self.server.stats()['opers'] == 0
+
+    def test_motd_cached(self):
+        self.server.config = self.server.config._replace(motd=('hello',))
+        self.register_user(self.user, 'shira')
+        motd = self.server.motd
+        self.server.msg_received(self.user, 'motd')
+        assert self.server.motd is motd
+
     # Miscellaneous tests
 
     def test_invalid_command_before_registration(self):
@@ -0,0 +1,92 @@
+from throttle import ConnectionThrottle, network
+from config import DEFAULT_CONFIG
+
+from twisted.internet.task import Clock
+
+
+class FakeUser(object):
+    def __init__(self, host):
+        self.host = host
+
+
+class TestConnectionThrottle:
+    def setup_method(self, method):
+        self.clock = Clock()
+        self.config = DEFAULT_CONFIG._replace(max_per_ip=2, max_per_net=3,
+                                              connect_rate=1.0,
+                                              connect_burst=10,
+                                              max_unregistered=5)
+        self.throttle = ConnectionThrottle(self.config, self.clock)
+
+    def connect(self, host):
+        if not self.throttle.accept(host):
+            return None
+        user = FakeUser(host)
+        self.throttle.connected(user)
+        return user
+
+    def test_network(self):
+        assert network('10.1.2.3') == network('10.1.2.200')
+        assert network('10.1.2.3') != network('10.1.3.3')
+        assert network('2001:db8::1') == network('2001:db8::ffff:1')
+        assert network('2001:db8:0:1::1') != network('2001:db8::1')
+        assert network('localhost') == 'localhost'
+
+    def test_per_ip(self):
+        user = self.connect('10.0.0.1')
+        assert self.connect('10.0.0.1')
+        assert not self.connect('10.0.0.1')
+
+        self.throttle.disconnected(user)
+        assert self.connect('10.0.0.1')
+
+    def test_per_net(self):
+        assert self.connect('10.0.0.1')
+        assert self.connect('10.0.0.2')
+        assert self.connect('10.0.0.3')
+        assert not self.connect('10.0.0.4')
+        assert self.connect('10.0.1.1')
+        assert self.throttle.rejected == 1
+
+    def test_counters_released(self):
+        users = [self.connect('10.0.0.1'), self.connect('10.0.0.2')]
+        for user in users:
+            self.throttle.disconnected(user)
+        assert self.throttle.per_ip == {}
+        assert self.throttle.per_net == {}
+        assert self.throttle.connections == {}
+
+    def test_disconnect_untracked(self):
+        self.throttle.disconnected(FakeUser('10.0.0.1'))
+        assert self.throttle.per_ip == {}
+
+    def test_connect_rate(self):
+        self.throttle.config = self.config._replace(max_per_ip=100,
+                                                    max_per_net=100,
+                                                    max_unregistered=100,
+                                                    connect_burst=3)
+        for i in range(3):
+            self.throttle.disconnected(self.connect('10.0.0.1'))
+        assert not self.connect('10.0.0.1')
+        assert self.connect('10.0.0.2')
+
+        self.clock.advance(1)
+        assert self.connect('10.0.0.1')
+        assert not self.connect('10.0.0.1')
+
+    def test_idle_buckets_expire(self):
+        self.throttle.disconnected(self.connect('10.0.0.1'))
+        self.clock.advance(5)
+        self.throttle.disconnected(self.connect('10.0.0.2'))
+        assert len(self.throttle.buckets) == 2
+
+        self.clock.advance(6)
+        self.throttle.disconnected(self.connect('10.0.0.3'))
+        assert self.throttle.buckets.keys() == ['10.0.0.2', '10.0.0.3']
+
+    def test_max_unregistered(self):
+        users = [self.connect('10.0.{}.1'.format(i)) for i in range(5)]
+        assert not self.connect('10.0.9.1')
+
+        self.throttle.registered(users[0])
+        assert self.connect('10.0.9.1')
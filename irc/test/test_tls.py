@@ -0,0 +1,70 @@
+import pytest
+
+SSL = pytest.importorskip('OpenSSL.SSL')
+
+from tls import TLSContextFactory, HandshakeStats, make_self_signed
+
+
+def pump(client, server):
+    for src, dst in [(client, server), (server, client)]:
+        try:
+            data = src.bio_read(65536)
+        except SSL.WantReadError:
+            continue
+        dst.bio_write(data)
+
+def handshake(server_ctx, session=None):
+    client = SSL.Connection(SSL.Context(SSL.SSLv23_METHOD), None)
+    client.set_connect_state()
+    if session is not None:
+        client.set_session(session)
+    server = SSL.Connection(server_ctx, None)
+    server.set_accept_state()
+
+    for i in range(10):
+        for conn in [client, server]:
+            try:
+                conn.do_handshake()
+            except SSL.WantReadError:
+                pass
+        pump(client, server)
+
+    # TLS 1.3 delivers session tickets after the handshake
+    server.send('hello')
+    pump(client, server)
+    assert client.recv(5) == 'hello'
+    return client, server
+
+
+class TestTLS:
+    @pytest.fixture
+    def factory(self, tmpdir):
+        certfile = str(tmpdir.join('server.crt'))
+        keyfile = str(tmpdir.join('server.key'))
+        make_self_signed(certfile, keyfile)
+        return TLSContextFactory(certfile, keyfile)
+
+    def test_shared_context(self, factory):
+        assert factory.getContext() is factory.getContext()
+
+    def test_session_resumption(self, factory):
+        stats = HandshakeStats()
+        client, server = handshake(factory.getContext())
+        stats.record(0.002, server)
+
+        client, server = handshake(factory.getContext(), client.get_session())
+        stats.record(0.001, server)
+
+        assert stats.full == 1
+        assert stats.resumed == 1
+        assert stats.mean_latency() == pytest.approx(0.0015)
+        assert stats.max_latency == 0.002
+
+
+    def test_rate(self):
+        now = [100.0]
+        stats = HandshakeStats(clock=lambda: now[0])
+        stats.full = 30
+        stats.resumed = 20
+        now[0] = 110.0
+        assert stats.rate() == 5.0
@@ -1,6 +1,7 @@
-from user import User
+from user import User, UserFactory
 from mock import Mock
 
+from twisted.internet.address import IPv4Address
 from twisted.test.proto_helpers import StringTransport
 
 
@@ -12,10 +13,74 @@ class TestUser:
         self.user.makeConnection(self.transport)
         self.line = "cmd arg1 arg2 :trailing"
 
-    def test_lineReceived(self):
-        self.user.lineReceived(self.line)
-        self.server.msg_received.assert_called_once_with(self.user, self.line)
+    def test_linesReceived(self):
+        self.user.linesReceived([self.line, self.line])
+        self.server.lines_received.assert_called_once_with(
+            self.user, [self.line, self.line])
 
     def test_send(self):
         self.user.send(self.line)
         assert self.transport.value() == self.line + '\r\n'
+
+    def test_close(self):
+        self.user.close()
+        assert self.transport.disconnecting
+
+    def test_connectionLost(self):
+        self.user.connectionLost(None)
+        self.server.connection_lost.assert_called_once_with(self.user)
+
+    def test_handshakeCompleted(self):
+        self.user.handshakeCompleted()
+        args = self.server.handshake_completed.call_args[0]
+        assert args[0] is self.user
+        assert args[1] >= 0
+
+    def test_sendq_exceeded(self):
+        self.server.config.sendq = 10
+        self.user.sendq.pauseProducing()
+        self.transport.abortConnection = Mock()
+        self.user.send('123456')
+        assert not self.transport.abortConnection.called
+        self.user.send('123456')
+        self.transport.abortConnection.assert_called_once_with()
+        assert self.transport.value() == '123456\r\n'
+
+    def test_sendq_reset_on_resume(self):
+        self.server.config.sendq = 10
+        self.user.sendq.pauseProducing()
+        self.user.send('123456')
+        self.user.sendq.resumeProducing()
+        self.user.sendq.pauseProducing()
+        self.user.send('123456')
+        assert not self.transport.disconnecting
+
+    def test_dataReceived(self):
+        self.user.dataReceived(self.line + '\r\n' + self.line + '\n')
+        self.server.lines_received.assert_called_once_with(
+            self.user, [self.line, self.line])
+
+
+class TestUserFactory:
+    def setup_method(self, method):
+        self.server = Mock()
+        self.factory = UserFactory(self.server)
+        self.addr = IPv4Address('TCP', '10.0.0.1', 12345)
+
+    def test_buildProtocol(self):
+        user = self.factory.buildProtocol(self.addr)
+        assert isinstance(user, User)
+        assert user.host == '10.0.0.1'
+        self.server.throttle.accept.assert_called_once_with('10.0.0.1')
+        self.server.throttle.connected.assert_called_once_with(user)
+
+    def test_buildProtocol_rejected(self):
+        self.server.throttle.accept.return_value = False
+        protocol = self.factory.buildProtocol(self.addr)
+        assert not isinstance(protocol, User)
+        assert not self.server.throttle.connected.called
+
+        transport = StringTransport()
+        protocol.makeConnection(transport)
+        assert transport.value().startswith('ERROR :Closing Link')
+        assert transport.disconnecting
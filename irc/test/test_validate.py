@@ -0,0 +1,26 @@
+from validate import valid_nick, valid_chan
+
+
+def test_nick_length():
+    assert valid_nick('a' * 9, 9)
+    assert not valid_nick('a' * 10, 9)
+    assert valid_nick('a' * 10, 30)
+
+
+def test_nick_characters():
+    assert valid_nick('[a]\\b`_^{|}-9', 30)
+    for c in '!@#$%&*()+=:;,. \x00\x80\xff':
+        assert not valid_nick('a' + c, 30)
+
+
+def test_chan_types():
+    assert valid_chan('#a', '#&', 50)
+    assert valid_chan('&a', '#&', 50)
+    assert not valid_chan('+a', '#&', 50)
+    assert not valid_chan('#', '#&', 50)
+
+
+def test_chan_characters():
+    assert valid_chan('#\x01\x80\xff!@', '#', 50)
+    for c in '\x00\x07\n\r ,:':
+        assert not valid_chan('#a' + c, '#', 50)
@@ -0,0 +1,43 @@
+from whowas import WhowasHistory
+
+
+class FakeUser(object):
+    def __init__(self):
+        self.username = 'stacey'
+        self.host = 'localhost'
+        self.realname = 'Stacey'
+
+
+class TestWhowasHistory:
+    def setup_method(self, method):
+        self.history = WhowasHistory(3)
+        self.user = FakeUser()
+
+    def test_lookup_newest_first(self):
+        self.history.add('shira', self.user)
+        self.user.realname = 'Shira'
+        self.history.add('Shira', self.user)
+
+        entries = self.history.lookup('SHIRA')
+        assert [e.realname for e in entries] == ['Shira', 'Stacey']
+        assert len(self.history.lookup('shira', 1)) == 1
+        assert len(self.history.lookup('shira', 0)) == 2
+        assert len(self.history.lookup('shira', -1)) == 2
+        assert self.history.lookup('santa') == []
+
+    def test_bounded(self):
+        for n in range(10):
+            self.history.add('nick{}'.format(n), self.user)
+
+        assert len(self.history) == 3
+        assert self.history.lookup('nick6') == []
+        assert [e.nick for e in self.history.lookup('nick9')] == ['nick9']
+
+    def test_overwrite_oldest_of_nick(self):
+        self.history.add('shira', self.user)
+        self.history.add('santa', self.user)
+        self.history.add('shira', self.user)
+        self.history.add('santa', self.user)
+
+        assert len(self.history.lookup('shira')) == 1
+        assert len(self.history.lookup('santa')) == 2
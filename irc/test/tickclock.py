@@ -0,0 +1,13 @@
+from twisted.internet.task import Clock
+
+
+class TickClock(Clock):
+    # Like the reactor, and unlike Clock.advance, run only the calls that
+    # were already due when the tick started
+    def tick(self):
+        now = self.seconds()
+        due = [c for c in self.calls if c.getTime() <= now]
+        for c in due:
+            self.calls.remove(c)
+            c.called = 1
+            c.func(*c.args, **c.kw)
@@ -0,0 +1,96 @@
+from collections import OrderedDict
+
+import socket
+
+IPV4_PREFIX = 24
+IPV6_PREFIX = 64
+
+def network(host):
+    # The packed address truncated to its /24 or /64, used as a dict key
+    for family, bits in [(socket.AF_INET, IPV4_PREFIX),
+                         (socket.AF_INET6, IPV6_PREFIX)]:
+        try:
+            packed = socket.inet_pton(family, host)
+        except (socket.error, ValueError):
+            continue
+        nbytes, rem = divmod(bits, 8)
+        key = packed[:nbytes]
+        if rem:
+            key += chr(ord(packed[nbytes]) & (0xff << (8 - rem)) & 0xff)
+        return key
+    return host
+
+class ConnectionThrottle(object):
+    # Counts open connections per address and per network, and keeps a
+    # connect-rate token bucket per address. Buckets are kept in order of
+    # last use so that idle ones are expired from the front as new
+    # connections arrive.
+    def __init__(self, config, clock):
+        self.config = config
+        self.clock = clock
+        self.connections = {}
+        self.per_ip = {}
+        self.per_net = {}
+        self.buckets = OrderedDict()
+        self.unregistered = set()
+        self.rejected = 0
+
+    def accept(self, host):
+        config = self.config
+        if (len(self.unregistered) >= config.max_unregistered or
+            self.per_ip.get(host, 0) >= config.max_per_ip or
+            self.per_net.get(network(host), 0) >= config.max_per_net or
+            not self.take_token(host)):
+            self.rejected += 1
+            return False
+        return True
+
+    def take_token(self, host):
+        now = self.clock.seconds()
+        rate = self.config.connect_rate
+        burst = self.config.connect_burst
+        self.expire(now)
+
+        tokens, last = self.buckets.pop(host, (burst, now))
+        tokens = min(burst, tokens + (now - last) * rate)
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        self.buckets[host] = (tokens, now)
+        return allowed
+
+    def expire(self, now):
+        # a bucket left alone long enough to refill is the same as no bucket
+        idle = self.config.connect_burst / float(self.config.connect_rate)
+        buckets = self.buckets
+        while buckets:
+            host, (tokens, last) = next(buckets.iteritems())
+            if now - last < idle:
+                break
+            del buckets[host]
+
+    def connected(self, user):
+        host = user.host
+        net = network(host)
+        self.connections[user] = (host, net)
+        self.per_ip[host] = self.per_ip.get(host, 0) + 1
+        self.per_net[net] = self.per_net.get(net, 0) + 1
+        self.unregistered.add(user)
+
+    def registered(self, user):
+        self.unregistered.discard(user)
+
+    def disconnected(self, user):
+        self.unregistered.discard(user)
+        try:
+            host, net = self.connections.pop(user)
+        except KeyError:
+            return
+        self._decrement(self.per_ip, host)
+        self._decrement(self.per_net, net)
+
+    def _decrement(self, counts, key):
+        if counts[key] == 1:
+            del counts[key]
+        else:
+            counts[key] -= 1
@@ -0,0 +1,91 @@
+from OpenSSL import SSL, crypto
+from twisted.internet import ssl
+
+import time
+
+SESSION_ID = 'irc-sds'
+SESSION_TIMEOUT = 3600
+
+def session_reused(connection):
+    # pyOpenSSL only exposes this on newer releases
+    reused = getattr(connection, 'session_reused', None)
+    if reused is not None:
+        return bool(reused())
+    return bool(SSL._lib.SSL_session_reused(connection._ssl))
+
+def make_self_signed(certfile, keyfile, common_name='localhost'):
+    key = crypto.PKey()
+    key.generate_key(crypto.TYPE_RSA, 2048)
+
+    cert = crypto.X509()
+    cert.get_subject().CN = common_name
+    cert.set_serial_number(1)
+    cert.gmtime_adj_notBefore(0)
+    cert.gmtime_adj_notAfter(365 * 24 * 60 * 60)
+    cert.set_issuer(cert.get_subject())
+    cert.set_pubkey(key)
+    cert.sign(key, 'sha256')
+
+    with open(certfile, 'w') as f:
+        f.write(crypto.dump_certificate(crypto.FILETYPE_PEM, cert))
+    with open(keyfile, 'w') as f:
+        f.write(crypto.dump_privatekey(crypto.FILETYPE_PEM, key))
+
+class TLSContextFactory(ssl.ContextFactory):
+    # A single context is shared by every connection so that its session
+    # cache and ticket keys let reconnecting clients resume their sessions
+    # instead of paying for a full handshake
+    def __init__(self, certfile, keyfile, session_timeout=SESSION_TIMEOUT):
+        ctx = SSL.Context(SSL.SSLv23_METHOD)
+        ctx.set_options(SSL.OP_NO_SSLv2 | SSL.OP_NO_SSLv3 |
+                        SSL.OP_NO_COMPRESSION)
+        ctx.use_certificate_chain_file(certfile)
+        ctx.use_privatekey_file(keyfile)
+        ctx.check_privatekey()
+
+        ctx.set_session_id(SESSION_ID)
+        ctx.set_session_cache_mode(SSL.SESS_CACHE_SERVER)
+        ctx.set_timeout(session_timeout)
+        self._context = ctx
+
+    def getContext(self):
+        return self._context
+
+class HandshakeStats(object):
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self.started = clock()
+        self.full = 0
+        self.resumed = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    def record(self, latency, connection):
+        if session_reused(connection):
+            self.resumed += 1
+        else:
+            self.full += 1
+        self.total_latency += latency
+        self.max_latency = max(self.max_latency, latency)
+
+    @property
+    def count(self):
+        return self.full + self.resumed
+
+    def rate(self):
+        elapsed = self.clock() - self.started
+        if elapsed <= 0:
+            return 0.0
+        return self.count / elapsed
+
+    def mean_latency(self):
+        if not self.count:
+            return 0.0
+        return self.total_latency / self.count
+
+    def report(self):
+        return ('{} TLS handshakes ({} resumed), {:.1f}/s, mean latency '
+                '{:.1f} ms, max {:.1f} ms'.format(self.count, self.resumed,
+                                                  self.rate(),
+                                                  self.mean_latency() * 1000,
+                                                  self.max_latency * 1000))
@@ -1,36 +1,97 @@
 from codes import *
-from twisted.protocols.basic import LineReceiver
+from framer import IRCLineFramer
 
-from twisted.internet.protocol import ServerFactory
+from twisted.internet.interfaces import IHandshakeListener, IPushProducer
+from twisted.internet.protocol import Protocol, ServerFactory
+from zope.interface import implementer
+
+import time
 
 UNSET_NICK = '*'
 
-class User(LineReceiver):
+@implementer(IPushProducer)
+class SendQ(object):
+    # Counts the bytes written while the transport's buffer is full
+    def __init__(self):
+        self.blocked = False
+        self.size = 0
+
+    def pauseProducing(self):
+        self.blocked = True
+
+    def resumeProducing(self):
+        self.blocked = False
+        self.size = 0
+
+    def stopProducing(self):
+        pass
+
+@implementer(IHandshakeListener)
+class User(IRCLineFramer):
     def __init__(self, server, addr):
+        IRCLineFramer.__init__(self)
         self.server = server
         self.addr = addr
+        self.host = getattr(addr, 'host', addr)
         self.registered = False
         self.nick = UNSET_NICK
+        self.username = None
         self.realname = None
+        self.oper = False
         self.channels = []
-        
+        self.caps = frozenset()
+        self.cap_negotiating = False
+        self.password = None
+        self.checking = False
+        self.authenticated = False
+        self.away = None
+        self.sendq = SendQ()
+
     def connectionMade(self):
-        pass
+        self.connected_at = time.time()
+        self.transport.registerProducer(self.sendq, True)
+
+    def handshakeCompleted(self):
+        self.server.handshake_completed(self, time.time() - self.connected_at)
 
     def connectionLost(self, reason):
-        pass
+        self.server.connection_lost(self)
 
-    def lineReceived(self, line):
-        self.server.msg_received(self, line)
+    def linesReceived(self, lines):
+        self.server.lines_received(self, lines)
 
     def send(self, line):
+        if self.sendq.blocked:
+            self.sendq.size += len(line) + len(self.delimiter)
+            if self.sendq.size > self.server.config.sendq:
+                print "SendQ exceeded for {}".format(self.nick)
+                # loseConnection would wait to flush the very buffer that
+                # overflowed, so drop the connection outright
+                self.transport.abortConnection()
+                return
         self.sendLine(line)
 
+    def close(self):
+        self.transport.loseConnection()
+
 class UserFactory(ServerFactory):
     def __init__(self, server):
         self.server = server
 
     def buildProtocol(self, addr):
-        return User(self.server, addr)
+        throttle = self.server.throttle
+        if not throttle.accept(addr.host):
+            return Rejected()
+
+        user = User(self.server, addr)
+        throttle.connected(user)
+        return user
+
+class Rejected(Protocol):
+    # Turned away before any per-user state is allocated
+    def connectionMade(self):
+        self.transport.write('ERROR :Closing Link: Too many connections, '
+                             'try again later\r\n')
+        self.transport.loseConnection()
 
 
@@ -0,0 +1,24 @@
+import string
+
+NICK_FIRST = string.ascii_letters + '[]\\`_^{|}'
+NICK_CHARS = NICK_FIRST + string.digits + '-'
+# channel names may hold any byte but these
+CHAN_FORBIDDEN = '\x00\x07\n\r ,:'
+
+def char_table(allowed):
+    # Maps each allowed byte to itself and every other byte to NUL, so a
+    # single translate and search checks a whole name
+    return ''.join(chr(i) if chr(i) in allowed else '\0' for i in range(256))
+
+NICK_TABLE = char_table(NICK_CHARS)
+CHAN_TABLE = char_table([chr(i) for i in range(256)
+                         if chr(i) not in CHAN_FORBIDDEN])
+NICK_FIRST_SET = frozenset(NICK_FIRST)
+
+def valid_nick(nick, nicklen):
+    return (len(nick) <= nicklen and nick[:1] in NICK_FIRST_SET and
+            '\0' not in nick.translate(NICK_TABLE))
+
+def valid_chan(name, chantypes, channellen):
+    return (1 < len(name) <= channellen and name[0] in chantypes and
+            '\0' not in name.translate(CHAN_TABLE))
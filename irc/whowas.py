@@ -0,0 +1,50 @@
+from collections import deque, namedtuple
+
+from mask import irc_lower
+
+WHOWAS_SIZE = 1024
+
+WhowasEntry = namedtuple('WhowasEntry', 'nick username host realname')
+
+class WhowasHistory(object):
+    # A fixed number of slots is reused in order, so the history never
+    # holds more than `size` entries however many nicks come and go
+    def __init__(self, size=WHOWAS_SIZE):
+        self._entries = [None] * size
+        self._next = 0
+        self._count = 0
+        self._nicks = {}
+
+    def __len__(self):
+        return self._count
+
+    def add(self, nick, user):
+        slot = self._next
+        old = self._entries[slot]
+        if old is None:
+            self._count += 1
+        else:
+            # the slot being reused always holds the oldest entry for its
+            # nick, which is at the front of that nick's deque
+            key = irc_lower(old.nick)
+            slots = self._nicks[key]
+            slots.popleft()
+            if not slots:
+                del self._nicks[key]
+
+        self._entries[slot] = WhowasEntry(nick, user.username, user.host,
+                                          user.realname)
+        key = irc_lower(nick)
+        try:
+            self._nicks[key].append(slot)
+        except KeyError:
+            self._nicks[key] = deque([slot])
+        self._next = (slot + 1) % len(self._entries)
+
+    def lookup(self, nick, count=None):
+        slots = self._nicks.get(irc_lower(nick), ())
+        entries = [self._entries[slot] for slot in reversed(slots)]
+        # like WHOWAS itself, a count of zero or less means every entry
+        if count is not None and count > 0:
+            entries = entries[:count]
+        return entries